@@ -0,0 +1,396 @@
+# Copyright 2016-2019 Dirk Thomas
+# Licensed under the Apache License, Version 2.0
+
+# Parsing of the colcon environment hooks of an install prefix, shared by the
+# _local_setup_util_*.py front-ends of the different shells. The parsed hooks
+# form a shell-independent index which is cached in the prefix and rebuilt when
+# any of the files it was built from changes.
+
+from collections import OrderedDict
+import hashlib
+import heapq
+import json
+import os
+from pathlib import Path
+
+
+DSV_TYPE_PREPEND_NON_DUPLICATE = 'prepend-non-duplicate'
+DSV_TYPE_PREPEND_NON_DUPLICATE_IF_EXISTS = 'prepend-non-duplicate-if-exists'
+DSV_TYPE_SET = 'set'
+DSV_TYPE_SET_IF_UNSET = 'set-if-unset'
+DSV_TYPE_SOURCE = 'source'
+
+# operations of the index, rendered to shell commands by the front-ends
+OP_COMMENT = 'comment'
+OP_SET = 'set'
+OP_SET_IF_UNSET = 'set-if-unset'
+OP_PREPEND = 'prepend'
+OP_SOURCE = 'source'
+
+# bump when the format of the index changes
+INDEX_VERSION = 1
+INDEX_DIRECTORY = '.colcon_dsv_index'
+
+
+def get_index(prefix_path, merged_install):
+    """
+    Get the environment hooks of all packages in the prefix.
+
+    The index is read from the cache in the prefix if none of the files it was
+    built from has changed since, otherwise it is built and cached.
+
+    :param Path prefix_path: The install prefix path of all packages
+    :param bool merged_install: The flag if the packages are all installed
+      directly in the prefix
+    :returns: A list of (package name, package prefix, operations) in
+      topological order, each operation is a list starting with one of the
+      OP_* types
+    :rtype: list
+    """
+    cache_paths = _index_cache_paths(prefix_path, merged_install)
+    for cache_path in cache_paths:
+        index = load_index(cache_path)
+        if index is not None:
+            return index
+    consulted_paths = {}
+    index = build_index(prefix_path, merged_install, consulted_paths)
+    for cache_path in cache_paths:
+        if store_index(cache_path, index, consulted_paths):
+            break
+    return index
+
+
+def build_index(prefix_path, merged_install, consulted_paths):
+    """
+    Parse the environment hooks of all packages in the prefix.
+
+    :param dict consulted_paths: A mapping from the paths the index depends on
+      to their state to add to
+    :returns: See get_index()
+    :rtype: list
+    """
+    global _consulted_paths
+    _consulted_paths = consulted_paths
+    _consulted_path(Path(__file__))
+    packages = get_packages(prefix_path, merged_install)
+
+    index = []
+    for pkg_name in order_packages(packages):
+        prefix = os.path.abspath(str(prefix_path))
+        if not merged_install:
+            prefix = os.path.join(prefix, pkg_name)
+        operations = []
+        package_dsv_path = os.path.join(
+            prefix, 'share', pkg_name, 'package.dsv')
+        if _consulted_path(package_dsv_path):
+            operations += process_dsv_file(package_dsv_path, prefix)
+        index.append([pkg_name, prefix, operations])
+    return index
+
+
+def get_packages(prefix_path, merged_install):
+    """
+    Find packages based on colcon-specific files created during installation.
+
+    :param Path prefix_path: The install prefix path of all packages
+    :param bool merged_install: The flag if the packages are all installed
+      directly in the prefix or if each package is installed in a subdirectory
+      named after the package
+    :returns: A mapping from the package name to the set of runtime
+      dependencies
+    :rtype: dict
+    """
+    packages = {}
+    # since importing colcon_core isn't feasible here the following constant
+    # must match colcon_core.location.get_relative_package_index_path()
+    subdirectory = 'share/colcon-core/packages'
+    if merged_install:
+        # return if workspace is empty
+        if not _consulted_path(prefix_path / subdirectory):
+            return packages
+        # find all files in the subdirectory
+        for p in (prefix_path / subdirectory).iterdir():
+            if not p.is_file():
+                continue
+            if p.name.startswith('.'):
+                continue
+            add_package_runtime_dependencies(p, packages)
+    else:
+        # a package added or removed changes the mtime of the prefix
+        _consulted_path(prefix_path)
+        # for each subdirectory look for the package specific file
+        for p in prefix_path.iterdir():
+            if not p.is_dir():
+                continue
+            if p.name.startswith('.'):
+                continue
+            p = p / subdirectory / p.name
+            if _consulted_path(p):
+                add_package_runtime_dependencies(p, packages)
+
+    # remove unknown dependencies
+    pkg_names = set(packages.keys())
+    for k in packages.keys():
+        packages[k] = {d for d in packages[k] if d in pkg_names}
+
+    return packages
+
+
+def add_package_runtime_dependencies(path, packages):
+    """
+    Check the path and if it exists extract the packages runtime dependencies.
+
+    :param Path path: The resource file containing the runtime dependencies
+    :param dict packages: A mapping from package names to the sets of runtime
+      dependencies to add to
+    """
+    _consulted_path(path)
+    content = path.read_text()
+    dependencies = set(content.split(os.pathsep) if content else [])
+    packages[path.name] = dependencies
+
+
+def order_packages(packages):
+    """
+    Order packages topologically.
+
+    :param dict packages: A mapping from package name to the set of runtime
+      dependencies
+    :returns: The package names
+    :rtype: list
+    """
+    # Kahn's algorithm, always selecting the alphabetically first package
+    # without remaining dependencies
+    remaining_deps = {}
+    dependents = {name: [] for name in packages}
+    for name, dependencies in packages.items():
+        remaining_deps[name] = len(dependencies)
+        for dependency in dependencies:
+            dependents[dependency].append(name)
+
+    ready = [name for name, count in remaining_deps.items() if not count]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        pkg_name = heapq.heappop(ready)
+        ordered.append(pkg_name)
+        for dependent in dependents[pkg_name]:
+            remaining_deps[dependent] -= 1
+            if not remaining_deps[dependent]:
+                heapq.heappush(ready, dependent)
+
+    if len(ordered) < len(packages):
+        ordered_names = set(ordered)
+        cycle = {
+            name: {d for d in dependencies if d not in ordered_names}
+            for name, dependencies in packages.items()
+            if name not in ordered_names}
+        reduce_cycle_set(cycle)
+        raise RuntimeError(
+            'Circular dependency between: ' + ', '.join(sorted(cycle)))
+    return ordered
+
+
+def reduce_cycle_set(packages):
+    """
+    Reduce the set of packages to the ones part of the circular dependency.
+
+    :param dict packages: A mapping from package name to the set of runtime
+      dependencies which is modified in place
+    """
+    last_depended = None
+    while len(packages) > 0:
+        # get all remaining dependencies
+        depended = set()
+        for pkg_name, dependencies in packages.items():
+            depended = depended.union(dependencies)
+        # remove all packages which are not dependent on
+        for name in list(packages.keys()):
+            if name not in depended:
+                del packages[name]
+        if last_depended:
+            # if remaining packages haven't changed return them
+            if last_depended == depended:
+                return packages.keys()
+        # otherwise reduce again
+        last_depended = depended
+
+
+def process_dsv_file(dsv_path, prefix):
+    """
+    Parse a dsv file and the dsv files it sources.
+
+    :returns: The operations in the order of the resulting shell commands
+    :rtype: list
+    """
+    operations = [[OP_COMMENT, dsv_path]]
+    _consulted_path(dsv_path)
+    with open(dsv_path, 'r') as h:
+        content = h.read()
+    lines = content.splitlines()
+
+    basenames = OrderedDict()
+    for i, line in enumerate(lines):
+        # skip over empty or whitespace-only lines
+        if not line.strip():
+            continue
+        try:
+            type_, remainder = line.split(';', 1)
+        except ValueError:
+            raise RuntimeError(
+                "Line %d in '%s' doesn't contain a semicolon separating the "
+                'type from the arguments' % (i + 1, dsv_path))
+        if type_ != DSV_TYPE_SOURCE:
+            # handle non-source lines
+            try:
+                operations += handle_dsv_types_except_source(
+                    type_, remainder, prefix)
+            except RuntimeError as e:
+                raise RuntimeError(
+                    "Line %d in '%s' %s" % (i + 1, dsv_path, e)) from e
+        else:
+            # group remaining source lines by basename
+            path_without_ext, ext = os.path.splitext(remainder)
+            if path_without_ext not in basenames:
+                basenames[path_without_ext] = set()
+            assert ext.startswith('.')
+            basenames[path_without_ext].add(ext[1:])
+
+    for basename, extensions in basenames.items():
+        if not os.path.isabs(basename):
+            basename = os.path.join(prefix, basename)
+        if _consulted_path(basename + '.dsv'):
+            # process dsv files recursively
+            operations += process_dsv_file(basename + '.dsv', prefix)
+        else:
+            # the front-end picks the script matching its shell
+            operations.append([OP_SOURCE, basename, sorted(extensions)])
+
+    return operations
+
+
+def handle_dsv_types_except_source(type_, remainder, prefix):
+    operations = []
+    if type_ in (DSV_TYPE_SET, DSV_TYPE_SET_IF_UNSET):
+        try:
+            env_name, value = remainder.split(';', 1)
+        except ValueError:
+            raise RuntimeError(
+                "doesn't contain a semicolon separating the environment name "
+                'from the value')
+        try_prefixed_value = os.path.join(prefix, value) if value else prefix
+        if _consulted_path(try_prefixed_value):
+            value = try_prefixed_value
+        if type_ == DSV_TYPE_SET:
+            operations.append([OP_SET, env_name, value])
+        elif type_ == DSV_TYPE_SET_IF_UNSET:
+            operations.append([OP_SET_IF_UNSET, env_name, value])
+        else:
+            assert False
+    elif type_ in (
+        DSV_TYPE_PREPEND_NON_DUPLICATE,
+        DSV_TYPE_PREPEND_NON_DUPLICATE_IF_EXISTS
+    ):
+        try:
+            env_name_and_values = remainder.split(';')
+        except ValueError:
+            raise RuntimeError(
+                "doesn't contain a semicolon separating the environment name "
+                'from the values')
+        env_name = env_name_and_values[0]
+        values = env_name_and_values[1:]
+        for value in values:
+            if not value:
+                value = prefix
+            elif not os.path.isabs(value):
+                value = os.path.join(prefix, value)
+            if (
+                type_ == DSV_TYPE_PREPEND_NON_DUPLICATE_IF_EXISTS and
+                not _consulted_path(value)
+            ):
+                comment = 'skip extending {env_name} with not existing path: ' \
+                    '{value}'.format_map(locals())
+                operations.append([OP_COMMENT, comment])
+            else:
+                operations.append([OP_PREPEND, env_name, value])
+    else:
+        raise RuntimeError(
+            'contains an unknown environment hook type: ' + type_)
+    return operations
+
+
+# paths the index depends on and their state while it is built
+_consulted_paths = {}
+
+
+def _path_state(path):
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _consulted_path(path):
+    """
+    Record the modification time of a path the index depends on.
+
+    :returns: True if the path exists
+    """
+    state = _path_state(path)
+    _consulted_paths[str(path)] = state
+    return state is not None
+
+
+def _index_cache_paths(prefix_path, merged_install):
+    name = 'merged.json' if merged_install else 'isolated.json'
+    # a hidden subdirectory, so that writing the cache doesn't change the
+    # mtime of the prefix which is part of the cache state itself
+    paths = [os.path.join(str(prefix_path), INDEX_DIRECTORY, name)]
+    # fall back to the user cache if the prefix is not writable
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(
+        os.path.abspath(str(prefix_path)).encode()).hexdigest()
+    paths.append(os.path.join(
+        cache_home, 'colcon_dsv_index', digest + '.' + name))
+    return paths
+
+
+def load_index(cache_path):
+    """
+    Read a cached index if none of the paths it depends on has changed.
+
+    :returns: The index or None
+    :rtype: list
+    """
+    try:
+        with open(cache_path, 'r') as h:
+            cache = json.load(h)
+    except (OSError, ValueError):
+        return None
+    if cache.get('version') != INDEX_VERSION:
+        return None
+    if any(_path_state(p) != state for p, state in cache['paths'].items()):
+        return None
+    return cache['index']
+
+
+def store_index(cache_path, index, consulted_paths):
+    cache = {
+        'version': INDEX_VERSION,
+        'paths': consulted_paths,
+        'index': index,
+    }
+    tmp_path = '%s.%d' % (cache_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'w') as h:
+            json.dump(cache, h)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,207 @@
+# /usr/bin/env python3
+
+import argparse
+import random
+import socketserver
+import struct
+import threading
+import time
+
+from .rochu_gripper_fma5_class import (pressure_addr, vacuum_addr, set_pressure_addr,
+                                       read_pressure_addr, read_vacuum_addr)
+
+#Modbus function codes served by the simulator
+READ_DISCRETE_INPUTS = 0x02
+WRITE_SINGLE_COIL = 0x05
+WRITE_SINGLE_REGISTER = 0x06
+#Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+SERVER_DEVICE_FAILURE = 0x04
+
+mbap_header = struct.Struct('>HHHB')
+
+
+class SimulatedACU:
+    #Register model of the Rochu ACU. The pressure (512) and vacuum (513) feedback
+    #follow the GRAB (256) and RELEASE (257) coils after an actuation delay with jitter.
+    def __init__(self, actuation_delay=0.05, jitter=0.01):
+        self.actuation_delay = actuation_delay
+        self.jitter = jitter
+        self.coils = {pressure_addr: False, vacuum_addr: False}
+        self.registers = {set_pressure_addr: 0}
+        #monotonic time at which each coil's feedback reaches its new value
+        self.settle_time = {pressure_addr: 0.0, vacuum_addr: 0.0}
+        self.lock = threading.Lock()
+
+    def write_coil(self, address, value):
+        with self.lock:
+            if self.coils[address] != value:
+                delay = max(0.0, random.gauss(self.actuation_delay, self.jitter)) if self.jitter else self.actuation_delay
+                self.settle_time[address] = time.monotonic() + delay
+            self.coils[address] = value
+
+    def write_register(self, address, value):
+        with self.lock:
+            self.registers[address] = value
+
+    def _feedback(self, coil, now):
+        #feedback keeps its previous value until the coil has settled
+        settled = now >= self.settle_time[coil]
+        return self.coils[coil] if settled else not self.coils[coil]
+
+    def discrete_inputs(self):
+        now = time.monotonic()
+        with self.lock:
+            pressure = self._feedback(pressure_addr, now)
+            vacuum = self._feedback(vacuum_addr, now)
+            #GRAB and RELEASE fight each other, neither level is reached
+            if self.coils[pressure_addr] and self.coils[vacuum_addr]:
+                pressure = vacuum = False
+            return {read_pressure_addr: pressure, read_vacuum_addr: vacuum}
+
+
+class FaultInjection:
+    #Probabilities (0-1) of each fault per request, plus a fixed response delay
+    def __init__(self, drop_rate=0.0, exception_rate=0.0, no_response_rate=0.0, response_delay=0.0):
+        self.drop_rate = drop_rate
+        self.exception_rate = exception_rate
+        self.no_response_rate = no_response_rate
+        self.response_delay = response_delay
+
+
+class _ModbusHandler(socketserver.BaseRequestHandler):
+    def _read_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        acu = self.server.acu
+        faults = self.server.faults
+        while True:
+            header = self._read_exactly(mbap_header.size)
+            if header is None:
+                return
+            tid, pid, length, unit_id = mbap_header.unpack(header)
+            pdu = self._read_exactly(length - 1)
+            if pdu is None:
+                return
+            self.server.requests += 1
+
+            roll = random.random()
+            if roll < faults.drop_rate:
+                return
+            roll -= faults.drop_rate
+            if roll < faults.no_response_rate:
+                continue
+            roll -= faults.no_response_rate
+            if roll < faults.exception_rate:
+                response = bytes([pdu[0] | 0x80, SERVER_DEVICE_FAILURE])
+            else:
+                response = self.process(acu, pdu)
+
+            if faults.response_delay:
+                time.sleep(faults.response_delay)
+            self.request.sendall(mbap_header.pack(tid, pid, len(response) + 1, unit_id) + response)
+
+    def process(self, acu, pdu):
+        function_code = pdu[0]
+        address, value = struct.unpack('>HH', pdu[1:5])
+        if function_code == READ_DISCRETE_INPUTS:
+            inputs = acu.discrete_inputs()
+            if any(address + i not in inputs for i in range(value)):
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            data = bytearray((value + 7) // 8)
+            for i in range(value):
+                if inputs[address + i]:
+                    data[i // 8] |= 1 << (i % 8)
+            return bytes([function_code, len(data)]) + bytes(data)
+        elif function_code == WRITE_SINGLE_COIL:
+            if address not in acu.coils:
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            acu.write_coil(address, value == 0xFF00)
+            return pdu[:5]
+        elif function_code == WRITE_SINGLE_REGISTER:
+            if address not in acu.registers:
+                return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+            acu.write_register(address, value)
+            return pdu[:5]
+        return bytes([function_code | 0x80, ILLEGAL_FUNCTION])
+
+
+class _ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RochuACUSimulator:
+    #Modbus TCP server emulating the Rochu ACU on localhost. Port 0 picks a free port.
+    def __init__(self, host='127.0.0.1', port=0, actuation_delay=0.05, jitter=0.01, faults=None):
+        self.acu = SimulatedACU(actuation_delay, jitter)
+        self.server = _ThreadedTCPServer((host, port), _ModbusHandler)
+        self.server.acu = self.acu
+        self.server.faults = faults if faults is not None else FaultInjection()
+        self.server.requests = 0
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def faults(self):
+        return self.server.faults
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Modbus TCP simulator of the Rochu ACU")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--actuation-delay", type=float, default=0.05, help="seconds until feedback follows a coil")
+    parser.add_argument("--jitter", type=float, default=0.01, help="standard deviation of the actuation delay")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of closing the connection on a request")
+    parser.add_argument("--exception-rate", type=float, default=0.0, help="probability of a device failure exception")
+    parser.add_argument("--no-response-rate", type=float, default=0.0, help="probability of ignoring a request")
+    parser.add_argument("--response-delay", type=float, default=0.0, help="seconds added before every response")
+    options = parser.parse_args(args)
+
+    faults = FaultInjection(options.drop_rate, options.exception_rate, options.no_response_rate, options.response_delay)
+    simulator = RochuACUSimulator(options.host, options.port, options.actuation_delay, options.jitter, faults)
+    print("Rochu ACU simulator listening on %s:%d" % (simulator.host, simulator.port))
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server.server_close()
+
+if __name__ == '__main__':
+    main()
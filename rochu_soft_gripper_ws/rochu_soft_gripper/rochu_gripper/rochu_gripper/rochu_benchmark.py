@@ -0,0 +1,125 @@
+# /usr/bin/env python3
+
+import argparse
+import asyncio
+import time
+
+from .rochu_acu_simulator import RochuACUSimulator, FaultInjection
+from .rochu_gripper_fma5_class import RochuGripper
+from .rochu_gripper_fma5_async import AsyncRochuGripper
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return float('nan')
+    index = min(len(ordered) - 1, int(round(fraction*(len(ordered) - 1))))
+    return ordered[index]
+
+def summary(name, samples):
+    ms = [s*1000 for s in samples]
+    return "%-28s n=%-5d p50=%8.2f ms  p95=%8.2f ms  p99=%8.2f ms  max=%8.2f ms" % (
+        name, len(ms), percentile(ms, 0.5), percentile(ms, 0.95), percentile(ms, 0.99), max(ms) if ms else float('nan'))
+
+def reset_to_idle(gripper):
+    gripper.cancel_pressure()
+    gripper.cancel_vacuum()
+    #wait for the feedback to drop back to MODE_IDLE
+    deadline = time.monotonic() + 2.0
+    while gripper.get_gripper_state() != 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def bench_grab_latency(gripper, iterations, timeout):
+    #request-to-confirmation latency of grab_and_wait
+    latencies = []
+    failures = 0
+    for _ in range(iterations):
+        reset_to_idle(gripper)
+        confirmed, latency = gripper.grab_and_wait(50, 100, 0, timeout, poll_interval=0.001)
+        if confirmed:
+            latencies.append(latency)
+        else:
+            failures += 1
+    reset_to_idle(gripper)
+    return latencies, failures
+
+def bench_sync_throughput(gripper, duration):
+    #commands per second through the blocking driver, alternating writes and state reads
+    count = 0
+    latencies = []
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        start = time.monotonic()
+        if count % 2:
+            gripper.get_gripper_state()
+        else:
+            gripper.set_pressure_value(count % 100, 100, 0)
+        latencies.append(time.monotonic() - start)
+        count += 1
+    return count/duration, latencies
+
+async def bench_async_throughput(host, port, duration, in_flight):
+    #commands per second through the asyncio driver with several requests pipelined
+    gripper = AsyncRochuGripper(host, port)
+    if not await gripper.c.open():
+        return 0.0
+    count = 0
+    end = time.monotonic() + duration
+
+    async def worker():
+        nonlocal count
+        while time.monotonic() < end:
+            await gripper.get_gripper_state()
+            count += 1
+
+    await asyncio.gather(*[worker() for _ in range(in_flight)])
+    gripper.c.close()
+    return count/duration
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark of the Rochu gripper driver")
+    parser.add_argument("--host", help="benchmark a running ACU or simulator instead of an in-process simulator")
+    parser.add_argument("--port", type=int, default=502)
+    parser.add_argument("--iterations", type=int, default=50, help="grab confirmations to measure")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per throughput run")
+    parser.add_argument("--in-flight", type=int, default=8, help="pipelined requests for the asyncio run")
+    parser.add_argument("--timeout", type=float, default=2.0, help="grab confirmation timeout in seconds")
+    parser.add_argument("--actuation-delay", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--response-delay", type=float, default=0.0, help="simulated network/PLC delay per request")
+    parser.add_argument("--exception-rate", type=float, default=0.0)
+    options = parser.parse_args(args)
+
+    simulator = None
+    host, port = options.host, options.port
+    if host is None:
+        faults = FaultInjection(exception_rate=options.exception_rate, response_delay=options.response_delay)
+        simulator = RochuACUSimulator(actuation_delay=options.actuation_delay, jitter=options.jitter, faults=faults).start()
+        host, port = simulator.host, simulator.port
+        print("Using in-process ACU simulator on %s:%d (actuation %.1f ms +/- %.1f ms)" % (
+            host, port, options.actuation_delay*1000, options.jitter*1000))
+
+    try:
+        gripper = RochuGripper(host, port)
+        if not gripper.pool.connect():
+            print("Could not connect to %s:%d" % (host, port))
+            return
+
+        latencies, failures = bench_grab_latency(gripper, options.iterations, options.timeout)
+        print(summary("grab confirmation", latencies) + "  unconfirmed=%d" % failures)
+
+        rate, latencies = bench_sync_throughput(gripper, options.duration)
+        print(summary("sync request round trip", latencies))
+        print("%-28s %10.1f commands/s" % ("sync throughput", rate))
+        gripper.pool.close()
+
+        rate = asyncio.get_event_loop().run_until_complete(
+            bench_async_throughput(host, port, options.duration, options.in_flight))
+        print("%-28s %10.1f commands/s (%d in flight)" % ("async throughput", rate, options.in_flight))
+        print("connection stats: %s" % gripper.pool.stats())
+    finally:
+        if simulator is not None:
+            simulator.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# /usr/bin/env python3
+
+from bisect import bisect_right
+from functools import lru_cache
+
+import yaml
+
+#ACU analog input: 0.05MPa/V, i.e. 20 mV per kPa
+mv_per_kpa = 1000/(1000*0.05)
+
+
+class PressureSetpointModel:
+    #Maps an effort percentage to the mV setpoint written to the ACU for one
+    #(min_effort, max_effort) range. The setpoints of whole percentages are
+    #computed once, so a request is a table lookup. An optional calibration
+    #table of (kPa, mV) points measured on the device replaces the nominal
+    #linear 0.05MPa/V characteristic by piecewise-linear interpolation.
+    def __init__(self, max_effort, min_effort=0, calibration=None):
+        self.max_effort = max_effort
+        self.min_effort = min_effort
+        self.calibration = tuple(sorted(calibration)) if calibration else None
+        self.table = [self._compute(percentage) for percentage in range(101)]
+
+    def pressure(self, percentage):
+        #requested pressure in kPa
+        return self.min_effort + (self.max_effort - self.min_effort)*percentage/100
+
+    def pressure_to_mv(self, pressure):
+        if self.calibration is None:
+            return pressure*mv_per_kpa
+        points = self.calibration
+        #clamp to the calibrated range, interpolate inside it
+        if pressure <= points[0][0]:
+            return points[0][1]
+        if pressure >= points[-1][0]:
+            return points[-1][1]
+        i = bisect_right([p for p, _ in points], pressure)
+        (p0, v0), (p1, v1) = points[i-1], points[i]
+        return v0 + (v1 - v0)*(pressure - p0)/(p1 - p0)
+
+    def _compute(self, percentage):
+        return round(self.pressure_to_mv(self.pressure(percentage)))
+
+    def voltage(self, percentage):
+        #setpoint in mV for the register
+        if percentage == int(percentage) and 0 <= percentage <= 100:
+            return self.table[int(percentage)]
+        return self._compute(percentage)
+
+
+@lru_cache(maxsize=32)
+def setpoint_model(max_effort, min_effort=0, calibration=None):
+    #one model per (range, calibration), calibration must be a tuple of (kPa, mV) pairs
+    return PressureSetpointModel(max_effort, min_effort, calibration)
+
+def load_calibration(file_path, name=None):
+    #Read the (kPa, mV) table of gripper `name` from a YAML file of the form
+    #  default: [[0, 0], [50, 1050], [100, 2000]]
+    #  '1': [[0, 0], [100, 1980]]
+    #falling back to the `default` entry. Returns None when there is no table.
+    if not file_path:
+        return None
+    with open(file_path) as f:
+        tables = yaml.safe_load(f) or {}
+    table = tables.get(name, tables.get('default'))
+    if not table:
+        return None
+    if len(table) < 2 or any(len(point) != 2 for point in table):
+        raise ValueError("Calibration table in %s needs at least two [kPa, mV] points" % file_path)
+    return tuple(sorted((float(p), float(v)) for p, v in table))
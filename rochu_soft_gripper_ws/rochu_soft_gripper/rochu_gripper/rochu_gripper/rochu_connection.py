@@ -0,0 +1,175 @@
+# /usr/bin/env python3
+
+from contextlib import contextmanager
+import queue
+import threading
+import time
+
+from pyModbusTCP.client import ModbusClient
+
+
+class ModbusConnectionPool:
+    #A small pool of Modbus TCP sessions to one ACU. Every request borrows an idle
+    #session, so a read and a write issued from different threads do not wait on
+    #the same socket. Closed sessions are reopened in a background thread with
+    #exponential backoff, so a stalled TCP connect never blocks the caller.
+    def __init__(self, host, port, size=2, timeout=1.0, backoff_initial=0.1, backoff_max=10.0):
+        self.host = host
+        self.port = port
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self.clients = [ModbusClient(host=host, port=port, timeout=timeout) for _ in range(size)]
+        self._idle = queue.Queue()
+        for client in self.clients:
+            self._idle.put(client)
+
+        self._lock = threading.Lock()
+        #notified and counted whenever a borrowed session is given back
+        self._returned = threading.Condition()
+        self._returns = 0
+        self._reconnect_thread = None
+        self._backoff = backoff_initial
+        self._next_attempt = 0.0
+        self._was_open = False
+
+        #counters and timings for monitoring
+        self.connect_attempts = 0
+        self.connect_failures = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.last_connect_duration = None
+        self.total_connect_duration = 0.0
+
+    def is_open(self):
+        return any(client.is_open() for client in self.clients)
+
+    def _open_closed_clients(self):
+        #returns True if every session is open afterwards
+        all_open = True
+        for client in self.clients:
+            if client.is_open():
+                continue
+            start = time.monotonic()
+            opened = client.open()
+            duration = time.monotonic() - start
+            with self._lock:
+                self.connect_attempts += 1
+                self.last_connect_duration = duration
+                self.total_connect_duration += duration
+                if opened:
+                    self.connects += 1
+                    if self._was_open:
+                        self.reconnects += 1
+                else:
+                    self.connect_failures += 1
+            all_open = all_open and opened
+        with self._lock:
+            if all_open:
+                self._backoff = self.backoff_initial
+                self._next_attempt = 0.0
+                self._was_open = True
+            else:
+                self._next_attempt = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff*2, self.backoff_max)
+        return all_open
+
+    def connect(self):
+        #blocking connect of every session, used at startup
+        self._open_closed_clients()
+        return self.is_open()
+
+    def reconnect(self):
+        #Non-blocking: reopen closed sessions in the background unless an attempt
+        #is already running or the backoff delay has not elapsed yet
+        if all(client.is_open() for client in self.clients):
+            return
+        with self._lock:
+            if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+                return
+            if time.monotonic() < self._next_attempt:
+                return
+            self._reconnect_thread = threading.Thread(target=self._open_closed_clients, daemon=True)
+            self._reconnect_thread.start()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        #Borrow an open session, yields None if none is available
+        client = None
+        try:
+            client = self._borrow(timeout)
+            if client is None:
+                self.reconnect()
+            yield client
+        finally:
+            if client is not None:
+                self._give_back(client)
+                if not client.is_open():
+                    self.reconnect()
+
+    def _borrow(self, timeout=None):
+        #Closed sessions go straight back to the queue, they are left to the reconnect
+        #thread. Waits for a busy session only while at least one session is open.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._returned:
+                returns = self._returns
+            for _ in range(len(self.clients)):
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    candidate = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    return None
+                if candidate.is_open():
+                    return candidate
+                self._idle.put(candidate)
+            #every session seen was closed, wait for an open one to be given back
+            with self._returned:
+                while self._returns == returns:
+                    if not self.is_open():
+                        return None
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._returned.wait(remaining)
+
+    def _give_back(self, client):
+        self._idle.put(client)
+        with self._returned:
+            self._returns += 1
+            self._returned.notify_all()
+
+    def health_check(self, address, count=1):
+        #Probe every idle open session with a read, closing the ones that do not answer
+        healthy = 0
+        for _ in range(len(self.clients)):
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if client.is_open() and client.read_discrete_inputs(address, count) is None:
+                    client.close()
+                healthy += client.is_open()
+            finally:
+                self._give_back(client)
+        self.reconnect()
+        return healthy
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_sessions': sum(client.is_open() for client in self.clients),
+                'pool_size': len(self.clients),
+                'connect_attempts': self.connect_attempts,
+                'connect_failures': self.connect_failures,
+                'connects': self.connects,
+                'reconnects': self.reconnects,
+                'last_connect_duration': self.last_connect_duration,
+                'mean_connect_duration': self.total_connect_duration/self.connect_attempts if self.connect_attempts else None,
+                'next_retry_in': max(0.0, self._next_attempt - time.monotonic()),
+            }
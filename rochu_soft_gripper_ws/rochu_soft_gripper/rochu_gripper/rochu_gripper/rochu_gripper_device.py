@@ -0,0 +1,207 @@
+# /usr/bin/env python3
+
+import time
+
+from rochu_gripper_msgs.msg import GripperState, GripperEvent
+from .rochu_gripper_fma5_class import RochuGripper, read_pressure_addr
+
+#Working pressure range of the gripper in kPa
+max_working_effort = 100
+min_working_effort = 0
+
+#event severities, same values as rcl_interfaces/Log
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+class RochuGripperDevice:
+    #Connection, state and request handling for a single Rochu gripper,
+    #shared by the single gripper node and the multi-gripper manager node
+    def __init__(self, logger, name, ip, port, max_effort=100, min_effort=0, keepalive_period=1.0, pool_size=2, on_event=None, calibration=None):
+        self.logger = logger
+        #called with every GripperEvent, the node stamps and publishes it
+        self.on_event = on_event
+        self.name_ = name
+        self.ip = ip
+        self.port = port
+
+        self.max_effort = max_effort
+        if self.max_effort > max_working_effort :
+            self.max_effort = max_working_effort
+            self.logger.warn("Max effort exceeds working pressure range of the gripper, set to 100kPa instead.")
+        self.min_effort = min_effort
+        if self.min_effort < min_working_effort :
+            self.min_effort = min_working_effort
+            self.logger.warn("Min effort falls below the working pressure range of the gripper, set to 0kPa instead.")
+
+        self.last_value = 0
+        self.last_mode = 3
+        self.connected_ = False
+        #last published (mode, connected, effort) and when it went out
+        self.keepalive_period = keepalive_period
+        self.last_published = None
+        self.last_publish_time = None
+        self.rochu = RochuGripper(self.ip ,self.port, pool_size, calibration=calibration)
+
+    def report(self, level, event_type, message, voltage=0, latency=0.0):
+        #log the message and publish it as a structured event
+        if level >= ERROR:
+            self.logger.error(message)
+        elif level >= WARN:
+            self.logger.warn(message)
+        else:
+            self.logger.info(message)
+        if self.on_event is None:
+            return
+        event = GripperEvent()
+        event.name = self.name_
+        event.type = event_type
+        event.mode.value = self.last_mode
+        event.effort = self.last_value
+        event.voltage = voltage
+        event.connected = self.connected_
+        event.latency = latency
+        event.level = level
+        event.message = message
+        self.on_event(event)
+
+    def describe(self):
+        return str(self.name_)+ " through IP: " + str(self.ip) + " PORT: " + str(self.port)
+
+    def connect(self):
+        #check for modbus tcp connectivity
+        if not self.rochu.pool.connect():
+            self.connected_ = False
+            self.report(ERROR, GripperEvent.EVENT_CONNECTION, "There was an issue connecting to Rochu gripper: " + self.describe())
+        else:
+            self.connected_ = True
+            self.report(INFO, GripperEvent.EVENT_CONNECTION, "Rochu gripper " + str(self.name_) +  " connected with IP: " + str(self.ip) + " PORT: " + str(self.port))
+        return self.connected_
+
+    def check_connection(self):
+        #never blocks: closed sessions are reopened in the background with backoff
+        connected = self.rochu.pool.is_open()
+        self.rochu.pool.reconnect()
+        changed = connected != self.connected_
+        self.connected_ = connected
+        if changed and not connected:
+            self.report(ERROR, GripperEvent.EVENT_CONNECTION, "Unexpected disconnection from Rochu gripper: " + self.describe() + ", attempting to reconnect")
+        elif changed:
+            self.report(INFO, GripperEvent.EVENT_CONNECTION, "Rochu gripper " + str(self.name_) +  " reconnected with IP: " + str(self.ip) + " PORT: " + str(self.port))
+            self.logger.info("Connection stats for Rochu gripper %s: %s" % (self.name_, self.rochu.pool.stats()))
+        return self.connected_
+
+    def get_state_msg(self, stamp):
+        state_msg = GripperState()
+        if not self.check_connection():
+            current_state = 3
+        else :
+            current_state = self.rochu.get_gripper_state()
+        if current_state != self.last_mode:
+            self.last_mode = current_state
+            self.report(INFO, GripperEvent.EVENT_MODE_CHANGE, "Rochu gripper %s reports mode %d" % (self.name_, current_state))
+
+        state_msg.stamp = stamp
+        state_msg.name = self.name_
+        state_msg.current_mode.value = current_state
+        state_msg.last_requested_effort = self.last_value
+        state_msg.connected = self.connected_
+        return state_msg
+
+    def poll_state(self, stamp):
+        #Returns a GripperState when the mode, connection or effort changed, or
+        #when the keepalive is due, None otherwise
+        now = time.monotonic()
+        keepalive_due = self.last_publish_time is None or now - self.last_publish_time >= self.keepalive_period
+        if keepalive_due:
+            #probe the idle sessions so a dead one is reopened before a request needs it
+            self.rochu.pool.health_check(read_pressure_addr)
+        state_msg = self.get_state_msg(stamp)
+        current = (state_msg.current_mode.value, state_msg.connected, state_msg.last_requested_effort)
+        if current == self.last_published and not keepalive_due:
+            return None
+        self.last_published = current
+        self.last_publish_time = now
+        return state_msg
+
+    def clamp_effort(self, percentage):
+        if percentage > 100 :
+            percentage = 100
+            self.report(WARN, GripperEvent.EVENT_ERROR, "Effort value exceeds 100 %, set to 100 % instead")
+
+        elif percentage < 0 :
+            percentage = 0
+            self.report(WARN, GripperEvent.EVENT_ERROR, "Effort value below 0 %, set to 0 % instead")
+        if percentage < self.last_value:
+            percentage = self.last_value
+            self.report(WARN, GripperEvent.EVENT_ERROR, "Effort value is lower then previous value, the gripper cannot decrease its pressure, please set to IDLE state and retrigger")
+        return percentage
+
+    def grab(self, percentage):
+        percentage = self.clamp_effort(percentage)
+        try:
+            _, voltage = self.rochu.set_pressure_value(percentage,self.max_effort,self.min_effort)
+
+            self.last_value = percentage
+            self.report(INFO, GripperEvent.EVENT_PRESSURE_SET, "Setting pressure to %d %% in range [%d:%d] kPa."%(percentage,self.min_effort,self.max_effort), voltage=voltage)
+
+            self.rochu.trigger_pressure()
+
+            self.report(INFO, GripperEvent.EVENT_MODE_REQUEST, "Setting mode to GRAB state")
+            return True
+
+        except:
+            self.report(ERROR, GripperEvent.EVENT_ERROR, "Could not trigger GRAB mode")
+            return False
+
+    def grab_and_wait(self, percentage, timeout):
+        #Trigger GRAB and block until the ACU confirms pressure or the timeout expires.
+        #Returns (confirmed, actuation latency in seconds)
+        if not self.connected_:
+            self.report(ERROR, GripperEvent.EVENT_ERROR, "Gripper not connected")
+            return False, 0.0
+        percentage = self.clamp_effort(percentage)
+        voltage = self.rochu.setpoint_model(self.max_effort,self.min_effort).voltage(percentage)
+        try:
+            confirmed, latency = self.rochu.grab_and_wait(percentage,self.max_effort,self.min_effort,timeout)
+        except:
+            self.report(ERROR, GripperEvent.EVENT_ERROR, "Could not trigger GRAB mode")
+            return False, 0.0
+        self.last_value = percentage
+        if confirmed:
+            self.last_mode = 0
+            self.report(INFO, GripperEvent.EVENT_GRAB_RESULT, "GRAB confirmed on Rochu gripper %s after %.1f ms" % (self.name_, latency*1000), voltage, latency)
+        else:
+            self.report(WARN, GripperEvent.EVENT_GRAB_RESULT, "GRAB not confirmed on Rochu gripper %s within %.1f s" % (self.name_, timeout), voltage, latency)
+        return confirmed, latency
+
+    def handle_request(self, request_msg):
+        if not self.connected_:
+            self.report(ERROR, GripperEvent.EVENT_ERROR, "Gripper not connected")
+            return
+        self.logger.info('Processing Request for Rochu Gripper name: "%s"' % self.name_)
+        #MODE_GRAB
+        if request_msg.request_mode.value == 0 :
+            self.grab(request_msg.effort)
+        #MODE_IDLE
+        elif request_msg.request_mode.value == 1 :
+            try:
+                self.rochu.cancel_pressure()
+                self.rochu.cancel_vacuum()
+                _, voltage = self.rochu.set_pressure_value(0,self.max_effort,0)
+                self.last_value = 0
+                self.report(INFO, GripperEvent.EVENT_MODE_REQUEST, "Setting mode to IDLE state", voltage=voltage)
+
+            except:
+                self.report(ERROR, GripperEvent.EVENT_ERROR, "Could not trigger IDLE mode")
+        #MODE_RELEASE
+        elif request_msg.request_mode.value == 2 :
+            try:
+                self.rochu.trigger_vacuum()
+                self.last_value = -70
+                self.report(INFO, GripperEvent.EVENT_MODE_REQUEST, "Setting mode to RELEASE state")
+            except:
+                self.report(ERROR, GripperEvent.EVENT_ERROR, "Could not trigger RELEASE mode")
+        else :
+            self.report(WARN, GripperEvent.EVENT_ERROR, "INVALID mode set")
@@ -0,0 +1,216 @@
+# /usr/bin/env python3
+
+import asyncio
+import struct
+import time
+
+from .rochu_gripper_fma5_class import (pressure_addr, vacuum_addr, set_pressure_addr,
+                                       read_pressure_addr, read_vacuum_addr, read_feedback_count,
+                                       pressure_to_voltage, decode_gripper_state)
+
+#Modbus function codes used by the ACU
+READ_DISCRETE_INPUTS = 0x02
+WRITE_SINGLE_COIL = 0x05
+WRITE_SINGLE_REGISTER = 0x06
+
+#MBAP header: transaction id, protocol id, length, unit id
+mbap_header = struct.Struct('>HHHB')
+
+
+class AsyncModbusClient:
+    #Modbus TCP client for asyncio. Requests are pipelined on one socket and
+    #matched to their responses by transaction id, so several reads and writes
+    #can be in flight at the same time. Like pyModbusTCP, the public methods
+    #return None on timeout, exception response or disconnection.
+    def __init__(self, host, port=502, unit_id=1, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self.timeout = timeout
+        self.last_error = None
+        #number of successful opens, lets callers notice a reconnection
+        self.connects = 0
+
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._next_tid = 0
+
+    def is_open(self):
+        return self._writer is not None
+
+    async def open(self, timeout=None):
+        if self.is_open():
+            return True
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                timeout if timeout is not None else self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.last_error = e
+            return False
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+        self.connects += 1
+        return True
+
+    def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        self._fail_pending(ConnectionError("Modbus connection closed"))
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    def _allocate_tid(self):
+        for _ in range(0x10000):
+            self._next_tid = (self._next_tid + 1) & 0xFFFF
+            if self._next_tid not in self._pending:
+                return self._next_tid
+        raise RuntimeError("No free Modbus transaction id")
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(mbap_header.size)
+                tid, _, length, _ = mbap_header.unpack(header)
+                pdu = await self._reader.readexactly(length - 1)
+                future = self._pending.pop(tid, None)
+                #response to a request that already timed out or was cancelled
+                if future is None or future.done():
+                    continue
+                if pdu[0] & 0x80:
+                    future.set_exception(IOError("Modbus exception code %d" % pdu[1]))
+                else:
+                    future.set_result(pdu)
+        except asyncio.CancelledError:
+            raise
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.last_error = e
+            self._reader = None
+            self._writer = None
+            self._reader_task = None
+            self._fail_pending(ConnectionError("Modbus connection lost"))
+
+    async def _request(self, function_code, payload, timeout=None):
+        if not self.is_open():
+            self.last_error = ConnectionError("Modbus connection not open")
+            return None
+        tid = self._allocate_tid()
+        future = asyncio.get_event_loop().create_future()
+        self._pending[tid] = future
+        pdu = bytes([function_code]) + payload
+        self._writer.write(mbap_header.pack(tid, 0, len(pdu) + 1, self.unit_id) + pdu)
+        try:
+            return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.last_error = e
+            return None
+        finally:
+            #also runs when the caller cancels the request
+            self._pending.pop(tid, None)
+
+    async def read_discrete_inputs(self, address, count=1, timeout=None):
+        pdu = await self._request(READ_DISCRETE_INPUTS, struct.pack('>HH', address, count), timeout)
+        if pdu is None:
+            return None
+        data = pdu[2:2 + pdu[1]]
+        return [bool(data[i // 8] >> (i % 8) & 1) for i in range(count)]
+
+    async def write_single_coil(self, address, value, timeout=None):
+        pdu = await self._request(WRITE_SINGLE_COIL,
+                                  struct.pack('>HH', address, 0xFF00 if value else 0x0000), timeout)
+        return None if pdu is None else True
+
+    async def write_single_register(self, address, value, timeout=None):
+        pdu = await self._request(WRITE_SINGLE_REGISTER,
+                                  struct.pack('>HH', address, value & 0xFFFF), timeout)
+        return None if pdu is None else True
+
+
+class AsyncRochuGripper:
+    #asyncio counterpart of RochuGripper with the same method names, each one a coroutine
+    def __init__(self, ip, port, timeout=1.0, calibration=None):
+        self.c = AsyncModbusClient(ip, port, timeout=timeout)
+        self.calibration = calibration
+        #last value written to set_pressure_addr and the connect count it was written on
+        self.last_setpoint = None
+        self.last_setpoint_connects = None
+
+    async def trigger_pressure(self):
+        return await self.c.write_single_coil(pressure_addr, True)
+
+    async def cancel_pressure(self):
+        return await self.c.write_single_coil(pressure_addr, False)
+
+    async def trigger_vacuum(self):
+        return await self.c.write_single_coil(vacuum_addr, True)
+
+    async def cancel_vacuum(self):
+        return await self.c.write_single_coil(vacuum_addr, False)
+
+    async def set_pressure_value(self, percentage, max_effort=120, min_effort=0):
+        voltage = pressure_to_voltage(percentage, max_effort, min_effort, self.calibration)
+        #skip the write if the register already holds this value on the current connection
+        if voltage == self.last_setpoint and self.c.connects == self.last_setpoint_connects:
+            return True, voltage
+        result = await self.c.write_single_register(set_pressure_addr, voltage)
+        self.last_setpoint = voltage if result else None
+        self.last_setpoint_connects = self.c.connects
+        return result, voltage
+
+    async def read_pressure_feedback(self):
+        #True if pressure more than P_1 value set on ACU
+        pressure = await self.c.read_discrete_inputs(read_pressure_addr, 1)
+        return None if pressure is None else pressure[0]
+
+    async def read_vacuum_feedback(self):
+        #True if pressure more than n_2 value set on ACU
+        vacuum = await self.c.read_discrete_inputs(read_vacuum_addr, 1)
+        return None if vacuum is None else vacuum[0]
+
+    async def read_feedback(self):
+        feedback = await self.c.read_discrete_inputs(read_pressure_addr, read_feedback_count)
+        if feedback is None:
+            return None
+        return feedback[0], feedback[read_vacuum_addr - read_pressure_addr]
+
+    async def get_gripper_state(self):
+        feedback = await self.read_feedback()
+        #MODE NOT DETERMINED if the ACU did not answer
+        if feedback is None:
+            return 3
+        return decode_gripper_state(*feedback)
+
+    async def wait_for_pressure(self, timeout=2.0, poll_interval=0.005):
+        #Wait until the ACU reports GRAB or the timeout expires. Returns (confirmed, seconds waited)
+        start = time.monotonic()
+        while True:
+            feedback = await self.read_feedback()
+            elapsed = time.monotonic() - start
+            if feedback is not None and decode_gripper_state(*feedback) == 0:
+                return True, elapsed
+            if elapsed >= timeout:
+                return False, elapsed
+            await asyncio.sleep(poll_interval)
+
+    async def grab_and_wait(self, percentage, max_effort=120, min_effort=0, timeout=2.0, poll_interval=0.005):
+        #Set the pressure, trigger GRAB and wait for the ACU to confirm it.
+        #Returns (confirmed, actuation latency in seconds measured from the trigger)
+        written, _ = await self.set_pressure_value(percentage, max_effort, min_effort)
+        #never grab at a stale setpoint
+        if not written:
+            return False, 0.0
+        start = time.monotonic()
+        if not await self.trigger_pressure():
+            return False, time.monotonic() - start
+        confirmed, _ = await self.wait_for_pressure(timeout, poll_interval)
+        return confirmed, time.monotonic() - start
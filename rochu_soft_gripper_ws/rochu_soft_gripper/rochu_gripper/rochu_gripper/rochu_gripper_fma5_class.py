@@ -1,69 +1,135 @@
 # /usr/bin/env python3
 
-from pyModbusTCP.client import ModbusClient
 import time
 import math
 
+from .rochu_connection import ModbusConnectionPool
+from .rochu_calibration import setpoint_model
+
 #ModBus addresses
 pressure_addr = 256
 vacuum_addr = 257
 set_pressure_addr = 775
 read_pressure_addr = 512
 read_vacuum_addr = 513
+#number of adjacent discrete inputs read in one go, starting at read_pressure_addr
+read_feedback_count = read_vacuum_addr - read_pressure_addr + 1
 
 class RochuGripper:
-    def __init__(self,ip,port):
-        #initialise modbustcp object
-        self.c = ModbusClient()
-        self.c.host(ip)
-        self.c.port(port)
+    def __init__(self,ip,port,pool_size=2,timeout=1.0,calibration=None):
+        #initialise pool of modbustcp sessions
+        self.pool = ModbusConnectionPool(ip, port, size=pool_size, timeout=timeout)
+        #(kPa, mV) calibration points of this device, see rochu_calibration.load_calibration
+        self.calibration = calibration
+        #last value written to set_pressure_addr and the pool connect count it was written on
+        self.last_setpoint = None
+        self.last_setpoint_connects = None
+
+    def _call(self, method, *args):
+        #run one Modbus request on a borrowed session, None if no session is open
+        with self.pool.connection() as c:
+            if c is None:
+                return None
+            return getattr(c, method)(*args)
     
     def trigger_pressure(self):
         toggle = True
-        return self.c.write_single_coil(pressure_addr, toggle)
+        return self._call('write_single_coil', pressure_addr, toggle)
         
     def cancel_pressure(self):
         toggle = False
-        return self.c.write_single_coil(pressure_addr, toggle)
+        return self._call('write_single_coil', pressure_addr, toggle)
     
     def trigger_vacuum(self):
         toggle = True
-        return self.c.write_single_coil(vacuum_addr, toggle)
+        return self._call('write_single_coil', vacuum_addr, toggle)
 
     def cancel_vacuum(self):
         toggle = False
-        return self.c.write_single_coil(vacuum_addr, toggle)
+        return self._call('write_single_coil', vacuum_addr, toggle)
     
+    def setpoint_model(self,max_effort=120,min_effort=0):
+        return setpoint_model(max_effort,min_effort,self.calibration)
+
     def set_pressure_value(self,percentage,max_effort=120,min_effort=0):
-        #0.05MPa/V
-        pressure_range = max_effort*(10**3) - min_effort*(10**3)
-        lower_bound_votlage = min_effort*(10**3)/((10**3)*0.05)
-        voltage_range = pressure_range/((10**3)*0.05)
-        #voltage send in mV
-        voltage = round(lower_bound_votlage+(voltage_range*percentage/100))
-        last_pressure = round(min_effort + (pressure_range*percentage/100))
-        return self.c.write_single_register(set_pressure_addr,voltage) , voltage 
+        voltage = self.setpoint_model(max_effort,min_effort).voltage(percentage)
+        #skip the write if the register already holds this value on the current sessions
+        if voltage == self.last_setpoint and self.pool.connects == self.last_setpoint_connects:
+            return True, voltage
+        result = self._call('write_single_register', set_pressure_addr,voltage)
+        if result:
+            self.last_setpoint = voltage
+            self.last_setpoint_connects = self.pool.connects
+        else:
+            self.last_setpoint = None
+        return result , voltage 
 
     def read_pressure_feedback(self):
         #True if pressure more than P_1 value set on ACU
-        pressure = self.c.read_discrete_inputs(read_pressure_addr,1)
-        return pressure[0]
+        pressure = self._call('read_discrete_inputs', read_pressure_addr,1)
+        return None if not pressure else pressure[0]
     
     def read_vacuum_feedback(self):
         #True if pressure more than n_2 value set on ACU
-        vacuum = self.c.read_discrete_inputs(read_vacuum_addr,1)
-        return vacuum[0]
+        vacuum = self._call('read_discrete_inputs', read_vacuum_addr,1)
+        return None if not vacuum else vacuum[0]
     
+    def read_feedback(self):
+        #Read pressure (512) and vacuum (513) feedback in a single transaction
+        #so that both bits come from the same snapshot of the ACU
+        feedback = self._call('read_discrete_inputs', read_pressure_addr,read_feedback_count)
+        if not feedback or len(feedback) < read_feedback_count:
+            return None
+        return feedback[0], feedback[read_vacuum_addr-read_pressure_addr]
+
     def get_gripper_state(self):
-        #MODE_GRAB
-        if self.read_pressure_feedback() and not self.read_vacuum_feedback():
-            return 0
-        #MODE_RELEASE
-        elif self.read_vacuum_feedback() and not self.read_pressure_feedback():
-            return 2
-        #MODE_IDLE
-        elif not self.read_pressure_feedback() and not self.read_vacuum_feedback():
-            return 1
-        #MODE NOT DETERMINED
-        else :
+        feedback = self.read_feedback()
+        #MODE NOT DETERMINED if the ACU did not answer
+        if feedback is None:
             return 3
+        pressure, vacuum = feedback
+        return decode_gripper_state(pressure, vacuum)
+
+    def wait_for_pressure(self,timeout=2.0,poll_interval=0.005):
+        #Block until the ACU reports GRAB (pressure above P_1) or the timeout expires.
+        #Returns (confirmed, seconds waited)
+        start = time.monotonic()
+        while True:
+            feedback = self.read_feedback()
+            elapsed = time.monotonic() - start
+            if feedback is not None and decode_gripper_state(*feedback) == 0:
+                return True, elapsed
+            if elapsed >= timeout:
+                return False, elapsed
+            time.sleep(poll_interval)
+
+    def grab_and_wait(self,percentage,max_effort=120,min_effort=0,timeout=2.0,poll_interval=0.005):
+        #Set the pressure, trigger GRAB and wait for the ACU to confirm it.
+        #Returns (confirmed, actuation latency in seconds measured from the trigger)
+        written, _ = self.set_pressure_value(percentage,max_effort,min_effort)
+        #never grab at a stale setpoint
+        if not written:
+            return False, 0.0
+        start = time.monotonic()
+        if not self.trigger_pressure():
+            return False, time.monotonic() - start
+        confirmed, _ = self.wait_for_pressure(timeout,poll_interval)
+        return confirmed, time.monotonic() - start
+
+def pressure_to_voltage(percentage,max_effort=120,min_effort=0,calibration=None):
+    #voltage send in mV, 0.05MPa/V unless a calibration table is given
+    return setpoint_model(max_effort,min_effort,calibration).voltage(percentage)
+
+def decode_gripper_state(pressure, vacuum):
+    #MODE_GRAB
+    if pressure and not vacuum:
+        return 0
+    #MODE_RELEASE
+    elif vacuum and not pressure:
+        return 2
+    #MODE_IDLE
+    elif not pressure and not vacuum:
+        return 1
+    #MODE NOT DETERMINED
+    else :
+        return 3
@@ -0,0 +1,154 @@
+# /usr/bin/env python3
+import queue
+import threading
+
+import rclpy
+from rclpy.node import Node
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup, ReentrantCallbackGroup
+
+from rclpy.executors import MultiThreadedExecutor
+
+from rochu_gripper_msgs.msg import GripperState, GripperRequest, GripperEvent
+from rochu_gripper_msgs.srv import GripperGrab
+from .rochu_gripper_device import RochuGripperDevice
+from .rochu_calibration import load_calibration
+
+class RochuGripperManagerNode(Node):
+    #Drives several Rochu grippers from one process: one Modbus connection, one
+    #state heartbeat and one request worker per device. Requests arrive on one
+    #shared rochu/request subscription and go to the worker of the gripper they
+    #name. Grabs use rochu/grab, the same service as the single gripper node.
+    def __init__(self):
+        super().__init__('rochu_gripper_manager_node')
+
+        self.devices = {}
+        self.timers = []
+        #per-device request queues, worker threads and the lock a device's commands take
+        self.request_queues = {}
+        self.workers = []
+        self.device_locks = {}
+        #all devices publish their state on the same topic, told apart by name
+        self.publisher_ = self.create_publisher(GripperState,'rochu/state',10)
+        #structured mode, pressure and error events for loggers
+        self.event_publisher_ = self.create_publisher(GripperEvent,'rochu/events',50)
+
+        for name in self.read_gripper_names():
+            device = self.create_device(name)
+            #a gripper that is not reachable at startup is retried by its heartbeat
+            device.connect()
+            self.devices[name] = device
+            #each heartbeat gets its own group so a stalled ACU does not hold up the others
+            self.timers.append(self.create_timer(1.0/self.poll_rate,
+                                                 lambda device=device: self.rochu_state_callback(device),
+                                                 callback_group=MutuallyExclusiveCallbackGroup()))
+            #requests are executed by a worker per device, so a slow Modbus call only holds up its own gripper
+            self.device_locks[name] = threading.Lock()
+            self.request_queues[name] = queue.Queue(maxsize=self.request_queue_size)
+            worker = threading.Thread(target=self.request_worker, args=(device,), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+        #one subscription for all devices, the callback only hands the request on
+        self.request_group = MutuallyExclusiveCallbackGroup()
+        self.rochu_request_sub = self.create_subscription(GripperRequest,'rochu/request',self.rochu_request_callback,
+                                                          10,callback_group=self.request_group)
+        #a grab blocks until the ACU confirms; grabs of different grippers run concurrently,
+        #grabs and requests of one gripper take turns on its lock
+        self.grab_group = ReentrantCallbackGroup()
+        self.rochu_grab_srv = self.create_service(GripperGrab,'rochu/grab',self.rochu_grab_callback,callback_group=self.grab_group)
+
+    def read_gripper_names(self):
+        self.declare_parameter("rochu.names",["1"])
+        self.declare_parameter("rochu.num_threads",2)
+        self.declare_parameter("rochu.poll_rate",100.0)
+        self.declare_parameter("rochu.keepalive_period",1.0)
+        self.declare_parameter("rochu.pool_size",2)
+        #requests waiting per gripper, further requests are dropped with a warning
+        self.declare_parameter("rochu.request_queue_size",10)
+        #YAML file of per-gripper (kPa, mV) calibration tables, empty for the nominal 0.05MPa/V
+        self.declare_parameter("rochu.calibration_file","")
+        names = self.get_parameter('rochu.names')._value
+        self.num_threads = self.get_parameter('rochu.num_threads')._value
+        self.poll_rate = self.get_parameter('rochu.poll_rate')._value
+        self.keepalive_period = self.get_parameter('rochu.keepalive_period')._value
+        self.pool_size = self.get_parameter('rochu.pool_size')._value
+        self.request_queue_size = self.get_parameter('rochu.request_queue_size')._value
+        self.calibration_file = self.get_parameter('rochu.calibration_file')._value
+        self.get_logger().info('[PARAM] ROCHU_POLL_RATE: "%s" ROCHU_KEEPALIVE_PERIOD: "%s"' % (self.poll_rate, self.keepalive_period))
+        self.get_logger().info('[PARAM] ROCHU_NAMES: "%s"' % ", ".join(names))
+        return names
+
+    def create_device(self, name):
+        #per-device parameters live under rochu.<name>
+        prefix = "rochu." + name + "."
+        self.declare_parameter(prefix + "ip","192.168.1.200")
+        self.declare_parameter(prefix + "port",502)
+        self.declare_parameter(prefix + "max_effort",100)
+        self.declare_parameter(prefix + "min_effort",0)
+
+        ip = self.get_parameter(prefix + 'ip')._value
+        port = self.get_parameter(prefix + 'port')._value
+        max_effort = self.get_parameter(prefix + 'max_effort')._value
+        min_effort = self.get_parameter(prefix + 'min_effort')._value
+        self.get_logger().info('[PARAM] ROCHU "%s": IP "%s" PORT "%s" EFFORT [%s:%s] kPa' % (name, ip, port, min_effort, max_effort))
+        calibration = load_calibration(self.calibration_file, name)
+        return RochuGripperDevice(self.get_logger(), name, ip, port, max_effort, min_effort, self.keepalive_period, self.pool_size, self.publish_event, calibration)
+
+    def publish_event(self, event):
+        event.stamp = self.get_clock().now().to_msg()
+        self.event_publisher_.publish(event)
+
+    def rochu_state_callback(self, device):
+        state_msg = device.poll_state(self.get_clock().now().to_msg())
+        if state_msg is not None:
+            self.publisher_.publish(state_msg)
+
+    def rochu_request_callback(self,request_msg):
+        requests = self.request_queues.get(request_msg.name)
+        if requests is None:
+            self.get_logger().warn('No Rochu gripper named "%s" on this node' % request_msg.name)
+            return
+        try:
+            requests.put_nowait(request_msg)
+        except queue.Full:
+            self.get_logger().warn('Request queue of Rochu gripper "%s" is full, request dropped' % request_msg.name)
+
+    def request_worker(self,device):
+        requests = self.request_queues[device.name_]
+        while True:
+            request_msg = requests.get()
+            with self.device_locks[device.name_]:
+                device.handle_request(request_msg)
+
+    def rochu_grab_callback(self,request,response):
+        device = self.devices.get(request.name)
+        if device is None:
+            self.get_logger().warn('No Rochu gripper named "%s" on this node' % request.name)
+            response.current_mode.value = 3
+            return response
+        with self.device_locks[device.name_]:
+            response.success, response.latency = device.grab_and_wait(request.effort, request.timeout)
+            response.current_mode.value = 0 if response.success else device.rochu.get_gripper_state()
+        return response
+
+def main(args=None):
+    rclpy.init(args=args)
+    manager_node = RochuGripperManagerNode()
+    executor = MultiThreadedExecutor(num_threads=manager_node.num_threads)
+
+    executor.add_node(manager_node)
+
+    try:
+        executor.spin()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        executor.shutdown()
+        manager_node.destroy_node()
+
+    rclpy.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# /usr/bin/env python3
+
+import csv
+import gzip
+import logging
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+
+#fields of a gripper event record, in csv column order
+event_fields = ('time', 'name', 'event', 'mode', 'effort', 'voltage', 'connected', 'latency', 'debug_level', 'msg')
+
+#binary log layout: magic header, then per record
+#time (float64), debug level, event, mode, connected (uint8), effort (int16), voltage (int32),
+#latency (float64), name length (uint8), message length (uint16), utf-8 name, utf-8 message
+binary_magic = b'RLOG3\n'
+binary_record = struct.Struct('<dBBBBhidBH')
+max_binary_name = 0xFF
+max_binary_msg = 0xFFFF
+#(min, max) of the integer fields, values outside are clamped
+binary_ranges = {'debug_level': (0, 0xFF), 'event': (0, 0xFF), 'mode': (0, 0xFF),
+                 'effort': (-0x8000, 0x7FFF), 'voltage': (-0x80000000, 0x7FFFFFFF)}
+
+_stop = object()
+
+
+def pack_binary_record(record):
+    #Returns the packed record; integer fields are clamped to their ranges
+    values = dict((field, min(max(int(record[field]), low), high))
+                  for field, (low, high) in binary_ranges.items())
+    name = str(record['name']).encode('utf-8')[:max_binary_name]
+    msg = str(record['msg']).encode('utf-8')[:max_binary_msg]
+    return b''.join((binary_record.pack(float(record['time']), values['debug_level'], values['event'],
+                                        values['mode'], bool(record['connected']), values['effort'],
+                                        values['voltage'], float(record['latency']), len(name), len(msg)),
+                     name, msg))
+
+
+class BufferedLogSink:
+    #Writes log records from a background thread fed by a bounded queue, so the
+    #caller never waits on the disk. Records are written in batches and flushed
+    #every flush_interval seconds; the file is rotated when it exceeds max_bytes
+    #or is older than rotate_interval seconds, and rotated files can be gzipped.
+    #Records that cannot be written and disk errors are logged to logger and
+    #counted as dropped; the thread keeps running.
+    def __init__(self, file_path, fmt='csv', fieldnames=event_fields,
+                 queue_size=10000, batch_size=256, flush_interval=1.0,
+                 max_bytes=10*1024*1024, rotate_interval=0.0, compress=False, logger=None):
+        if fmt not in ('csv', 'binary'):
+            raise ValueError("Unknown log format: %s" % fmt)
+        self.file_path = file_path
+        self.fmt = fmt
+        self.fieldnames = list(fieldnames)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+
+        #records refused because the queue was full or that could not be written
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._open()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        #never blocks, returns False if the record had to be dropped
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        self._queue.put(_stop)
+        self._thread.join()
+
+    def _open(self):
+        directory = os.path.dirname(os.path.realpath(self.file_path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if self.fmt == 'csv':
+            self._file = open(self.file_path, 'w', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            self._writer.writeheader()
+        else:
+            self._file = open(self.file_path, 'wb')
+            self._file.write(binary_magic)
+        self._opened_at = time.monotonic()
+
+    def _write_batch(self, batch):
+        written = 0
+        if self.fmt == 'csv':
+            for record in batch:
+                try:
+                    self._writer.writerow(record)
+                    written += 1
+                except ValueError as e:
+                    self._drop("Could not write log record: %s" % e)
+        else:
+            chunks = []
+            for record in batch:
+                try:
+                    chunks.append(pack_binary_record(record))
+                except (KeyError, TypeError, ValueError, struct.error) as e:
+                    self._drop("Could not pack log record: %s" % e)
+            self._file.write(b''.join(chunks))
+            written = len(chunks)
+        self.written += written
+
+    def _drop(self, message, count=1):
+        self.dropped += count
+        self.logger.error(message)
+
+    def _rotation_due(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self._file.close()
+        root, ext = os.path.splitext(self.file_path)
+        rotated = "%s-%s-%d%s" % (root, time.strftime('%Y%m%d-%H%M%S'), self.rotations, ext)
+        os.rename(self.file_path, rotated)
+        if self.compress:
+            with open(rotated, 'rb') as source, gzip.open(rotated + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        self.rotations += 1
+        self._open()
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                record = self._queue.get(timeout=timeout)
+                if record is _stop:
+                    running = False
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+
+            flush_due = time.monotonic() - last_flush >= self.flush_interval
+            try:
+                if batch and (len(batch) >= self.batch_size or flush_due or not running):
+                    self._write_batch(batch)
+                    batch = []
+                if flush_due or not running:
+                    self._file.flush()
+                    last_flush = time.monotonic()
+                    if running and self._rotation_due():
+                        self._rotate()
+            except Exception as e:
+                #a disk error loses the batch, not the sink
+                self._drop("Log sink %s failed: %s" % (self.file_path, e), len(batch))
+                batch = []
+                last_flush = time.monotonic()
+        try:
+            self._file.close()
+        except Exception as e:
+            self.logger.error("Could not close %s: %s" % (self.file_path, e))
+
+
+def read_binary_log(file_path):
+    #Yields the records of a binary log as dicts, gzipped files are read transparently
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rb') as f:
+        if f.read(len(binary_magic)) != binary_magic:
+            raise ValueError("%s is not a binary rochu log" % file_path)
+        while True:
+            header = f.read(binary_record.size)
+            if len(header) < binary_record.size:
+                return
+            (timestamp, level, event, mode, connected, effort, voltage, latency,
+             name_length, msg_length) = binary_record.unpack(header)
+            name = f.read(name_length).decode('utf-8', 'replace')
+            msg = f.read(msg_length).decode('utf-8', 'replace')
+            yield {'time': timestamp, 'name': name, 'event': event, 'mode': mode, 'effort': effort,
+                   'voltage': voltage, 'connected': bool(connected), 'latency': latency,
+                   'debug_level': level, 'msg': msg}
@@ -1,20 +1,12 @@
 # /usr/bin/env python3
 import rclpy
 from rclpy.node import Node
-from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
-
-from rclpy.executors import MultiThreadedExecutor
-
-from rcl_interfaces.msg import Log
-import csv
-import ros2pkg
-from rclpy.time import Time
-import time
-from rosidl_runtime_py import get_interface_path
-# from ament_index_python.packages import get_package_directory
-import os
+
+from rochu_gripper_msgs.msg import GripperEvent
 from pathlib import Path
 
+from .rochu_log_sink import BufferedLogSink
+
 
 class LogNode(Node):
     def __init__(self):
@@ -22,21 +14,44 @@ class LogNode(Node):
 
         default_file_path =  str(Path.home())+"/logs/output.csv"
         self.declare_parameter("file_path",default_file_path)
+        #csv or binary (see rochu_log_sink.read_binary_log)
+        self.declare_parameter("format","csv")
+        #rotate when the file exceeds max_bytes or is older than rotate_interval seconds (0 disables)
+        self.declare_parameter("max_bytes",10*1024*1024)
+        self.declare_parameter("rotate_interval",0.0)
+        self.declare_parameter("compress",False)
+        self.declare_parameter("queue_size",10000)
+        self.declare_parameter("flush_interval",1.0)
+        #events below this severity are not recorded (20 INFO, 30 WARN, 40 ERROR)
+        self.declare_parameter("min_level",20)
+
         self.file_path = self.get_parameter('file_path')._value
+        self.min_level = self.get_parameter('min_level')._value
+        self.sink = BufferedLogSink(self.file_path,
+                                    fmt=self.get_parameter('format')._value,
+                                    queue_size=self.get_parameter('queue_size')._value,
+                                    flush_interval=self.get_parameter('flush_interval')._value,
+                                    max_bytes=self.get_parameter('max_bytes')._value,
+                                    rotate_interval=self.get_parameter('rotate_interval')._value,
+                                    compress=self.get_parameter('compress')._value,
+                                    logger=self.get_logger())
 
-        if not os.path.isdir(os.path.dirname(os.path.realpath(self.file_path))):
-            os.mkdir(os.path.dirname(os.path.realpath(self.file_path)))
-        
-        self.log_sub = self.create_subscription(Log,'/rosout',self.log_sub,10)
-        self.start_time =  time.time()
-        self.csvfile =  open(self.file_path, 'w', newline='')
-        fieldnames = ['debug_level', 'msg',"time"]
-        self.writer = csv.DictWriter(self.csvfile, fieldnames=fieldnames)
+        #only the gripper nodes' own events, not every message on /rosout
+        self.log_sub = self.create_subscription(GripperEvent,'rochu/events',self.log_sub,50)
 
     def log_sub(self,msg):
-        # print(msg)
-        if msg.name == "rochu_gripper_node" and msg.level >= 20:
-            self.writer.writerow({'debug_level': msg.level, 'msg': msg.msg,'time': time.time()-self.start_time})
+        if msg.level >= self.min_level:
+            #only queues the record, the sink thread does the disk I/O
+            self.sink.write({'time': msg.stamp.sec + msg.stamp.nanosec*1e-9,
+                             'name': msg.name,
+                             'event': msg.type,
+                             'mode': msg.mode.value,
+                             'effort': msg.effort,
+                             'voltage': msg.voltage,
+                             'connected': msg.connected,
+                             'latency': msg.latency,
+                             'debug_level': msg.level,
+                             'msg': msg.message})
     
 
 def main(args=None):
@@ -49,7 +64,7 @@ def main(args=None):
         pass
 
     finally:
-        log_node.csvfile.close()
+        log_node.sink.close()
         log_node.destroy_node()
         # rclpy.shutdown()
 
@@ -12,7 +12,9 @@ setup(
         ('share/' + package_name, ['package.xml']),
         ('share/' + package_name, ['launch/example.launch.py']),
         ('share/' + package_name, ['launch/example.launch.xml']),
-        ('share/' + package_name, ['config/params.yaml']),],
+        ('share/' + package_name, ['config/params.yaml']),
+        ('share/' + package_name, ['config/manager_params.yaml']),
+        ('share/' + package_name, ['config/calibration.yaml']),],
     install_requires=['setuptools'],
     zip_safe=True,
     maintainer='waihong',
@@ -22,7 +24,9 @@ setup(
     tests_require=['pytest'],
     entry_points={
         'console_scripts': [
-	'rochu_gripper_node = rochu_gripper.rochu_gripper_fma5_node:main','rochu_logger_node = rochu_gripper.rochu_logger_debug:main'
+	'rochu_gripper_node = rochu_gripper.rochu_gripper_fma5_node:main','rochu_logger_node = rochu_gripper.rochu_logger_debug:main',
+	'rochu_gripper_manager_node = rochu_gripper.rochu_gripper_manager_node:main',
+	'rochu_acu_simulator = rochu_gripper.rochu_acu_simulator:main','rochu_benchmark = rochu_gripper.rochu_benchmark:main'
         ],
     },
 )
\ No newline at end of file
@@ -0,0 +1,86 @@
+import threading
+
+from rochu_gripper import rochu_connection
+from rochu_gripper.rochu_connection import ModbusConnectionPool
+import pytest
+
+
+class FakeClient:
+
+    def __init__(self, host=None, port=None, timeout=None):
+        self.opened = False
+
+    def is_open(self):
+        return self.opened
+
+    def open(self):
+        return self.opened
+
+    def close(self):
+        self.opened = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(rochu_connection, 'ModbusClient', FakeClient)
+    # no background reconnects while the test runs
+    monkeypatch.setattr(ModbusConnectionPool, 'reconnect', lambda self: None)
+    return ModbusConnectionPool('127.0.0.1', 502, size=2)
+
+
+def borrow_concurrently(pool, threads, hold=None):
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def borrow():
+        barrier.wait()
+        with pool.connection() as client:
+            results.append(client)
+            if hold is not None and client is not None:
+                hold.wait(1.0)
+
+    workers = [threading.Thread(target=borrow, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(2.0)
+    return workers, results
+
+
+def test_all_sessions_closed_does_not_deadlock(pool):
+    # each thread takes one closed session before either looks further
+    taken = threading.Barrier(2)
+    first_get = threading.local()
+    get = pool._idle.get
+
+    def get_in_step(*args, **kwargs):
+        client = get(*args, **kwargs)
+        if not getattr(first_get, 'done', False):
+            first_get.done = True
+            try:
+                taken.wait(1.0)
+            except threading.BrokenBarrierError:
+                pass
+        return client
+    pool._idle.get = get_in_step
+
+    workers, results = borrow_concurrently(pool, 2)
+    assert not any(worker.is_alive() for worker in workers)
+    assert results == [None, None]
+    assert pool._idle.qsize() == 2
+
+
+def test_waits_for_the_open_session_in_use(pool):
+    pool.clients[0].opened = True
+    workers, results = borrow_concurrently(pool, 3)
+    assert not any(worker.is_alive() for worker in workers)
+    assert results == [pool.clients[0]] * 3
+    assert pool._idle.qsize() == 2
+
+
+def test_timeout_while_the_open_session_is_in_use(pool):
+    pool.clients[0].opened = True
+    with pool.connection() as first:
+        assert first is pool.clients[0]
+        with pool.connection(timeout=0.05) as second:
+            assert second is None
@@ -0,0 +1,38 @@
+from rochu_gripper.rochu_gripper_fma5_class import decode_gripper_state, RochuGripper
+import pytest
+
+
+@pytest.mark.parametrize('pressure, vacuum, state', [
+    (True, False, 0),
+    (False, False, 1),
+    (False, True, 2),
+    (True, True, 3),
+])
+def test_decode_gripper_state(pressure, vacuum, state):
+    assert decode_gripper_state(pressure, vacuum) == state
+
+
+def make_gripper(feedback):
+    # the pool only connects when a request borrows a session, _call is replaced
+    gripper = RochuGripper('127.0.0.1', 502)
+    calls = []
+
+    def call(method, *args):
+        calls.append((method,) + args)
+        return feedback
+    gripper._call = call
+    return gripper, calls
+
+
+def test_read_feedback_is_one_transaction():
+    gripper, calls = make_gripper([True, False])
+    assert gripper.read_feedback() == (True, False)
+    assert calls == [('read_discrete_inputs', 512, 2)]
+    assert gripper.get_gripper_state() == 0
+
+
+@pytest.mark.parametrize('feedback', [None, [], [True]])
+def test_missing_feedback_is_undetermined(feedback):
+    gripper, _ = make_gripper(feedback)
+    assert gripper.read_feedback() is None
+    assert gripper.get_gripper_state() == 3
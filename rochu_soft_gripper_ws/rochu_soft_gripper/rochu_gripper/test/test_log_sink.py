@@ -0,0 +1,86 @@
+import csv
+import glob
+import os
+import time
+
+from rochu_gripper.rochu_log_sink import BufferedLogSink, read_binary_log
+import pytest
+
+
+def make_record(i, msg='grab'):
+    return {'time': 1000.0 + i, 'name': '1', 'event': 1, 'mode': 0, 'effort': 50 + i,
+            'voltage': 1200, 'connected': True, 'latency': 0.0123456789, 'debug_level': 2, 'msg': msg}
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / 'gripper.rlog')
+    records = [make_record(i) for i in range(300)] + [make_record(300, 'pressure über P_1')]
+    sink = BufferedLogSink(path, fmt='binary', batch_size=64)
+    for record in records:
+        assert sink.write(record)
+    sink.close()
+
+    assert sink.written == len(records)
+    assert list(read_binary_log(path)) == records
+
+
+def test_csv_round_trip(tmp_path):
+    path = str(tmp_path / 'gripper.csv')
+    sink = BufferedLogSink(path)
+    sink.write(make_record(0))
+    sink.close()
+
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [dict((k, str(v)) for k, v in make_record(0).items())]
+
+
+def test_rotated_files_are_readable(tmp_path):
+    path = str(tmp_path / 'gripper.rlog')
+    sink = BufferedLogSink(path, fmt='binary', batch_size=1, flush_interval=0.01,
+                           max_bytes=1, compress=True)
+    records = [make_record(i) for i in range(3)]
+    for record in records:
+        sink.write(record)
+        # let the sink flush, and rotate, between the records
+        time.sleep(0.05)
+    sink.close()
+
+    assert sink.rotations >= 1
+    read = []
+    for rotated in sorted(glob.glob(os.path.join(str(tmp_path), 'gripper-*.rlog.gz'))):
+        read += list(read_binary_log(rotated))
+    read += list(read_binary_log(path))
+    assert read == records
+
+
+def test_out_of_range_fields_are_clamped(tmp_path):
+    path = str(tmp_path / 'gripper.rlog')
+    sink = BufferedLogSink(path, fmt='binary')
+    sink.write(dict(make_record(0), effort=100000, voltage=-2**40, mode=300))
+    sink.write(make_record(1))
+    sink.close()
+
+    records = list(read_binary_log(path))
+    assert [r['effort'] for r in records] == [32767, 51]
+    assert records[0]['voltage'] == -2**31
+    assert records[0]['mode'] == 255
+
+
+def test_bad_record_does_not_stop_the_sink(tmp_path):
+    path = str(tmp_path / 'gripper.rlog')
+    sink = BufferedLogSink(path, fmt='binary')
+    sink.write({'name': 'missing fields'})
+    sink.write(dict(make_record(0), effort='not a number'))
+    sink.write(make_record(1))
+    sink.close()
+
+    assert sink.dropped == 2
+    assert list(read_binary_log(path)) == [make_record(1)]
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / 'other.rlog'
+    path.write_bytes(b'not a log')
+    with pytest.raises(ValueError):
+        list(read_binary_log(str(path)))
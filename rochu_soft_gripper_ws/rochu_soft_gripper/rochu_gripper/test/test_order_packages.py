@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+
+import pytest
+
+# the colcon setup utilities are plain scripts next to the setup files
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rochu_gripper', 'install'))
+
+from _local_setup_util_dsv import order_packages  # noqa: E402
+
+
+def reference_order(packages):
+    # the quadratic ordering of colcon's original script
+    copied = {name: set(deps) for name, deps in packages.items()}
+    ordered = []
+    while copied:
+        for name in sorted(copied):
+            if not copied[name]:
+                break
+        else:
+            raise RuntimeError('cycle')
+        ordered.append(name)
+        del copied[name]
+        for deps in copied.values():
+            deps.discard(name)
+    return ordered
+
+
+def random_graph(count, seed):
+    rng = random.Random(seed)
+    names = ['pkg_%03d' % i for i in range(count)]
+    rng.shuffle(names)
+    # depending only on earlier names keeps the graph acyclic
+    return {name: set(rng.sample(names[:i], min(i, rng.randint(0, 3))))
+            for i, name in enumerate(names)}
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_reference_order(seed):
+    packages = random_graph(60, seed)
+    assert order_packages(packages) == reference_order(packages)
+
+
+def test_dependencies_come_first():
+    packages = {'c': {'a', 'b'}, 'b': {'a'}, 'a': set(), 'd': set()}
+    assert order_packages(packages) == ['a', 'b', 'c', 'd']
+
+
+def test_empty():
+    assert order_packages({}) == []
+
+
+def test_cycle_names_only_the_cycle():
+    packages = {'a': {'b'}, 'b': {'a'}, 'c': {'a'}, 'd': set()}
+    with pytest.raises(RuntimeError, match='Circular dependency between: a, b$'):
+        order_packages(packages)
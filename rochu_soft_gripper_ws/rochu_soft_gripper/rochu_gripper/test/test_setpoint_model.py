@@ -0,0 +1,72 @@
+from rochu_gripper.rochu_calibration import PressureSetpointModel, setpoint_model
+from rochu_gripper.rochu_gripper_fma5_class import pressure_to_voltage, RochuGripper
+import pytest
+
+
+def test_nominal_characteristic():
+    model = PressureSetpointModel(120)
+    # 0.05MPa/V is 20 mV per kPa
+    assert model.voltage(0) == 0
+    assert model.voltage(50) == 1200
+    assert model.voltage(100) == 2400
+
+
+def test_min_effort_offsets_the_range():
+    model = PressureSetpointModel(100, min_effort=20)
+    assert model.voltage(0) == 400
+    assert model.voltage(100) == 2000
+
+
+@pytest.mark.parametrize('percentage', [0, 1, 37, 99, 100])
+def test_table_matches_computed_value(percentage):
+    model = PressureSetpointModel(120, calibration=((0, 0), (50, 1050), (120, 2500)))
+    assert model.voltage(percentage) == model._compute(percentage)
+
+
+def test_fractional_and_out_of_range_percentages():
+    model = PressureSetpointModel(120)
+    assert model.voltage(12.5) == 300
+    assert model.voltage(110) == 2640
+
+
+def test_calibration_interpolates_and_clamps():
+    model = PressureSetpointModel(120, calibration=((100, 2000), (0, 0), (50, 1050)))
+    assert model.pressure_to_mv(25) == pytest.approx(525)
+    assert model.pressure_to_mv(75) == pytest.approx(1525)
+    assert model.pressure_to_mv(-10) == 0
+    assert model.pressure_to_mv(150) == 2000
+
+
+def test_models_are_shared_per_range():
+    assert setpoint_model(120) is setpoint_model(120)
+    assert setpoint_model(120) is not setpoint_model(100)
+    assert pressure_to_voltage(50) == 1200
+
+
+def test_unchanged_setpoint_is_not_written_again():
+    gripper = RochuGripper('127.0.0.1', 502)
+    writes = []
+
+    def call(method, *args):
+        writes.append(args)
+        return True
+    gripper._call = call
+    assert gripper.set_pressure_value(50) == (True, 1200)
+    assert gripper.set_pressure_value(50) == (True, 1200)
+    assert len(writes) == 1
+    # a reconnect may have reset the register
+    gripper.pool.connects += 1
+    gripper.set_pressure_value(50)
+    assert len(writes) == 2
+
+
+def test_grab_is_not_triggered_when_the_setpoint_write_fails():
+    gripper = RochuGripper('127.0.0.1', 502)
+    calls = []
+
+    def call(method, *args):
+        calls.append(method)
+        return method != 'write_single_register'
+    gripper._call = call
+    assert gripper.grab_and_wait(50) == (False, 0.0)
+    assert calls == ['write_single_register']
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Per-phase timing of the pick-and-place cycle
+#
+
+import json
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+try:
+  from time import monotonic
+except ImportError:
+  from time import time as monotonic
+
+import rospy
+from std_msgs.msg import String
+
+
+def percentile(ordered, fraction):
+  if not ordered:
+    return float('nan')
+  return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class CycleTrace(object):
+  """Records the duration of named phases, e.g. plan, execute or detect. Each
+  sample is published as JSON on the stats topic; report() logs the total
+  and the percentiles per phase."""
+  def __init__(self, topic='~cycle_stats', max_samples=10000):
+    self._lock = threading.Lock()
+    self.max_samples = max_samples
+    # phase -> durations in seconds
+    self.samples = OrderedDict()
+    self._stats_pub = rospy.Publisher(topic, String, queue_size=100)
+
+  def record(self, name, duration, obj=None):
+    with self._lock:
+      if name not in self.samples:
+        self.samples[name] = deque(maxlen=self.max_samples)
+      self.samples[name].append(duration)
+    sample = {'phase': name, 'duration': duration, 'stamp': rospy.get_time()}
+    if obj is not None:
+      sample['object'] = obj
+    self._stats_pub.publish(String(json.dumps(sample)))
+
+  @contextmanager
+  def phase(self, name, obj=None):
+    """
+    with trace.phase('plan', obj=i): ...
+    """
+    start = monotonic()
+    try:
+      yield
+    finally:
+      self.record(name, monotonic() - start, obj)
+
+  def summary(self):
+    """
+    @returns: list of (phase, n, total, p50, p95, p99, max), durations in seconds
+    """
+    with self._lock:
+      samples = [(name, sorted(values)) for name, values in self.samples.items()]
+    return [(name, len(ordered), sum(ordered), percentile(ordered, 0.5), percentile(ordered, 0.95),
+             percentile(ordered, 0.99), ordered[-1] if ordered else float('nan'))
+            for name, ordered in samples]
+
+  def report(self):
+    rows = self.summary()
+    if not rows:
+      return
+    lines = ["%-14s %6s %9s %9s %9s %9s %9s" % ("phase", "n", "total [s]", "p50 [ms]", "p95 [ms]", "p99 [ms]", "max [ms]")]
+    for name, n, total, p50, p95, p99, longest in rows:
+      lines.append("%-14s %6d %9.2f %9.1f %9.1f %9.1f %9.1f" % (
+          name, n, total, p50 * 1000, p95 * 1000, p99 * 1000, longest * 1000))
+    rospy.loginfo("Cycle time per phase:\n" + "\n".join(lines))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Work queue decoupling pick requests from detection and motion
+#
+
+import threading
+from collections import deque
+
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+import rospy
+from std_msgs.msg import Int32
+
+
+class DetectionQueue(object):
+  """Pick requests are queued by submit() and handled by two worker threads: one
+  runs detect(request) ahead of time, the other runs execute(request, detection).
+  Detection of the next request therefore overlaps with the motion of the current
+  one, but runs at most one request ahead; execute() decides whether a detection
+  taken during the previous motion can still be used. Requests already waiting are merged,
+  and at most maxsize requests are accepted at once; the number of accepted,
+  unfinished requests is published on depth_topic."""
+  def __init__(self, detect, execute, maxsize=4, depth_topic='~queue_depth'):
+    self.detect = detect
+    self.execute = execute
+    self.maxsize = maxsize
+
+    self._lock = threading.Lock()
+    self._has_requests = threading.Condition(self._lock)
+    self._requests = deque()
+    self._depth = 0
+    # detections waiting for the motion worker
+    self._detected = queue.Queue(maxsize=1)
+
+    self.merged = 0
+    self.dropped = 0
+    self._depth_pub = rospy.Publisher(depth_topic, Int32, queue_size=1, latch=True)
+    self._depth_pub.publish(Int32(0))
+
+    for target in (self._detect_loop, self._execute_loop):
+      thread = threading.Thread(target=target)
+      thread.daemon = True
+      thread.start()
+
+  def submit(self, request):
+    """
+    @returns: bool, False if the request was rejected because the queue is full
+    """
+    with self._lock:
+      if request in self._requests:
+        self.merged += 1
+        return True
+      if self._depth >= self.maxsize:
+        self.dropped += 1
+        rospy.logwarn("Pick queue full (%d requests), dropping request %s" % (self._depth, request))
+        return False
+      self._requests.append(request)
+      self._depth += 1
+      depth = self._depth
+      self._has_requests.notify()
+    self._depth_pub.publish(Int32(depth))
+    return True
+
+  def depth(self):
+    with self._lock:
+      return self._depth
+
+  def _detect_loop(self):
+    while not rospy.is_shutdown():
+      with self._lock:
+        while not self._requests:
+          self._has_requests.wait(0.5)
+          if rospy.is_shutdown():
+            return
+        request = self._requests.popleft()
+      try:
+        detection = self.detect(request)
+      except Exception as e:
+        rospy.logwarn("Detection for %s failed: %s" % (request, e))
+        detection = None
+      # blocks while the motion worker is busy and one detection is already waiting
+      self._detected.put((request, detection))
+
+  def _execute_loop(self):
+    while not rospy.is_shutdown():
+      try:
+        request, detection = self._detected.get(timeout=0.5)
+      except queue.Empty:
+        continue
+      try:
+        self.execute(request, detection)
+      except Exception as e:
+        rospy.logerr("Pick for %s failed: %s" % (request, e))
+      with self._lock:
+        self._depth -= 1
+        depth = self._depth
+      self._depth_pub.publish(Int32(depth))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Grasp with state feedback from the Robotiq or the Rochu soft gripper
+#
+
+import threading
+import time
+
+import rospy
+
+from send_gripper import GripperClient
+
+
+class RobotiqGrasp(object):
+  """Closes the Robotiq gripper through its GripperCommand action. The grasp is
+  confirmed when the fingers stop on the object before they are fully closed."""
+  def __init__(self, action='/gripper_controller/gripper_cmd', closed=0.8, opened=0.0,
+               min_gap=0.02, timeout=5.0):
+    self.closed = closed
+    self.opened = opened
+    self.min_gap = min_gap
+    self.timeout = timeout
+    self.client = GripperClient(action)
+    if not self.client.connect(timeout):
+      rospy.logwarn("Gripper action %s is not available" % action)
+
+  def command(self, position):
+    """
+    @returns: GripperCommandResult, None on timeout
+    """
+    return self.client.send(position, timeout=self.timeout)
+
+  def grasp(self):
+    result = self.command(self.closed)
+    return result is not None and result.position < self.closed - self.min_gap
+
+  def release(self):
+    return self.command(self.opened) is not None
+
+
+class RochuGrasp(object):
+  """Requests a grab from a Rochu soft gripper on rochu/request and waits until
+  rochu/state reports the mode from the ACU pressure feedback. The ROS 2 driver
+  is reached through ros1_bridge. The driver sets the pressure and vacuum coils
+  without clearing the other one, so the gripper passes through MODE_IDLE
+  between a release and the next grab."""
+  def __init__(self, name='1', effort=100, timeout=2.0,
+               request_topic='rochu/request', state_topic='rochu/state'):
+    # imported here so that the Robotiq setup does not need the bridged messages
+    from rochu_gripper_msgs.msg import GripperRequest, GripperState, GripperMode
+    self.GripperRequest = GripperRequest
+    self.GripperMode = GripperMode
+    self.name = name
+    self.effort = effort
+    self.timeout = timeout
+
+    self._changed = threading.Condition()
+    self._states = 0
+    self._mode = None
+    self._request_pub = rospy.Publisher(request_topic, GripperRequest, queue_size=1)
+    self._state_sub = rospy.Subscriber(state_topic, GripperState, self._state_callback)
+
+  def _state_callback(self, msg):
+    if msg.name != self.name:
+      return
+    with self._changed:
+      self._states += 1
+      self._mode = msg.current_mode.value
+      self._changed.notify_all()
+
+  def request(self, mode, effort=0):
+    """
+    Send a request and wait for a state reported after it, unless the gripper
+    already reports the mode
+    @returns: bool, True if the gripper reached the mode within the timeout
+    """
+    request = self.GripperRequest()
+    request.name = self.name
+    request.request_mode.value = mode
+    request.effort = effort
+
+    deadline = time.time() + self.timeout
+    with self._changed:
+      seen = self._states
+      already = self._mode == mode
+      self._request_pub.publish(request)
+      if already:
+        return True
+      while not rospy.is_shutdown():
+        if self._states != seen and self._mode == mode:
+          return True
+        seen = self._states
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return False
+        self._changed.wait(remaining)
+    return False
+
+  def grasp(self):
+    # a grab on top of a release sets both coils, which the ACU reports as undetermined
+    if not self.request(self.GripperMode.MODE_IDLE):
+      return False
+    return self.request(self.GripperMode.MODE_GRAB, self.effort)
+
+  def release(self):
+    released = (self.request(self.GripperMode.MODE_IDLE)
+                and self.request(self.GripperMode.MODE_RELEASE))
+    # clear the vacuum again so that the next grab is not mixed with it
+    return self.request(self.GripperMode.MODE_IDLE) and released
+
+
+def make_gripper(kind, **kwargs):
+  """
+  @param: kind  'robotiq', 'rochu' or 'none'
+  @returns: gripper with grasp() and release(), None for 'none'
+  """
+  if kind == 'robotiq':
+    return RobotiqGrasp(**kwargs)
+  if kind == 'rochu':
+    return RochuGrasp(**kwargs)
+  if kind == 'none':
+    return None
+  raise ValueError("Unknown gripper: %s" % kind)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# IK solutions cached over the table workspace, used to seed pick goals
+#
+
+import math
+
+import rospy
+from geometry_msgs.msg import PoseStamped
+from moveit_msgs.msg import RobotState, MoveItErrorCodes
+from moveit_msgs.srv import GetPositionIK, GetPositionIKRequest
+
+from pick_order import fold_yaw
+
+
+class IKSeedCache(object):
+  """Joint solutions for a grid of x, y and yaw bins on the pick plane. A cell is
+  solved the first time a goal falls into it, seeded from the nearest solved
+  cell, so neighbouring cells share one arm configuration and seeding a pick with
+  its cell avoids wrist flips."""
+  def __init__(self, group_name, make_pose, frame_id, x_min=0.2, x_max=0.7, y_min=-0.4, y_max=0.4,
+               z=0.18, resolution=0.05, yaw_bins=8, ik_service='/compute_ik', ik_timeout=0.05):
+    """
+    @param: make_pose  make_pose(x, y, z, yaw) returns the Pose of the end effector
+    """
+    self.group_name = group_name
+    self.make_pose = make_pose
+    self.frame_id = frame_id
+    self.x_min = x_min
+    self.y_min = y_min
+    self.z = z
+    self.resolution = resolution
+    self.nx = int(round((x_max - x_min) / resolution)) + 1
+    self.ny = int(round((y_max - y_min) / resolution)) + 1
+    self.yaw_bins = yaw_bins
+    self.ik_timeout = ik_timeout
+    self.ik_service = ik_service
+    self._compute_ik = None
+
+    self.joint_names = None
+    # joint positions the first cell is solved from, set by reset()
+    self.seed = None
+    # (i, j, k) -> joint positions
+    self.solutions = {}
+    # cells without a solution, not solved again
+    self.unreachable = set()
+
+  def cell_center(self, i, j, k):
+    return (self.x_min + i * self.resolution, self.y_min + j * self.resolution,
+            -math.pi / 2 + (k + 0.5) * math.pi / self.yaw_bins)
+
+  def cell_of(self, x, y, yaw):
+    i = min(max(int(round((x - self.x_min) / self.resolution)), 0), self.nx - 1)
+    j = min(max(int(round((y - self.y_min) / self.resolution)), 0), self.ny - 1)
+    k = min(int((fold_yaw(yaw) + math.pi / 2) / (math.pi / self.yaw_bins)), self.yaw_bins - 1)
+    return i, j, k
+
+  def solve(self, pose, seed, avoid_collisions=True):
+    """
+    @param: pose  Pose of the end effector in frame_id
+    @param: seed  joint positions in the order of joint_names
+    @returns: joint positions, None if there is no solution
+    """
+    if self._compute_ik is None:
+      try:
+        rospy.wait_for_service(self.ik_service, timeout=5.0)
+      except rospy.ROSException:
+        return None
+      self._compute_ik = rospy.ServiceProxy(self.ik_service, GetPositionIK, persistent=True)
+
+    seed_state = RobotState()
+    seed_state.joint_state.name = self.joint_names
+    seed_state.joint_state.position = seed
+    seed_state.is_diff = True
+
+    request = GetPositionIKRequest()
+    request.ik_request.group_name = self.group_name
+    request.ik_request.robot_state = seed_state
+    request.ik_request.avoid_collisions = avoid_collisions
+    request.ik_request.pose_stamped = PoseStamped()
+    request.ik_request.pose_stamped.header.frame_id = self.frame_id
+    request.ik_request.pose_stamped.pose = pose
+    request.ik_request.timeout = rospy.Duration(self.ik_timeout)
+    try:
+      response = self._compute_ik(request)
+    except rospy.ServiceException:
+      self._compute_ik = None
+      return None
+    if response.error_code.val != MoveItErrorCodes.SUCCESS:
+      return None
+    state = response.solution.joint_state
+    index = dict((name, i) for i, name in enumerate(state.name))
+    return [state.position[index[name]] for name in self.joint_names]
+
+  def reset(self, joint_names, seed):
+    """
+    Drop the solved cells; cells are solved again on demand
+    @param: joint_names  joints of the group
+    @param: seed         joint positions to solve the first cell from, e.g. the observe pose
+    """
+    self.joint_names = list(joint_names)
+    self.seed = list(seed)
+    self.solutions.clear()
+    self.unreachable.clear()
+
+  def nearest_solved(self, cell):
+    """
+    @returns: joint positions of the solved cell nearest to cell, the reset() seed if none is solved
+    """
+    if not self.solutions:
+      return self.seed
+    i, j, k = cell
+
+    def distance(other):
+      dk = abs(other[2] - k)
+      dk = min(dk, self.yaw_bins - dk)
+      return (other[0] - i) ** 2 + (other[1] - j) ** 2 + dk ** 2
+    return self.solutions[min(self.solutions, key=distance)]
+
+  def nearest(self, x, y, yaw):
+    """
+    Solution of the cell of x, y, yaw, solved now if it is not cached yet
+    @returns: joint positions, None before reset()
+    """
+    if self.joint_names is None:
+      return None
+    cell = self.cell_of(x, y, yaw)
+    solution = self.solutions.get(cell)
+    if solution is not None:
+      return solution
+    seed = self.nearest_solved(cell)
+    if cell not in self.unreachable:
+      cx, cy, cyaw = self.cell_center(*cell)
+      solution = self.solve(self.make_pose(cx, cy, self.z, cyaw), seed)
+      if solution is not None:
+        self.solutions[cell] = solution
+        return solution
+      self.unreachable.add(cell)
+    return seed
+
+  def joint_goal(self, x, y, z, yaw):
+    """
+    IK for the exact pose, seeded with the solution of its cell
+    @returns: joint positions, None if there is no solution
+    """
+    seed = self.nearest(x, y, yaw)
+    if seed is None:
+      return None
+    return self.solve(self.make_pose(x, y, z, yaw), seed)
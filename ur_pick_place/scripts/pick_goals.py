@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+#
+# Goals and plans of the pick-and-place cycle, shared by the node and the headless model
+#
+
+from collections import namedtuple
+
+
+# object to pick at x, y seen from the pre-grasp height z, gripper rotated by yaw
+PickGoal = namedtuple('PickGoal', 'x y z yaw')
+
+# joint values where a grasped object is released, skipped if the pick before failed
+PlaceGoal = namedtuple('PlaceGoal', 'joints')
+
+
+class PickPlan(object):
+  """Planned pick: the approach ends at the grasp pose, the lift returns to the
+  pre-grasp pose once the grasp is confirmed"""
+  def __init__(self, approach, lift):
+    self.approach = approach
+    self.lift = lift
+
+
+def trajectory_end(plan):
+  """
+  @param: plan  A RobotTrajectory or a PickPlan
+  @returns: (joint names, positions) of the last waypoint, None if the plan is empty
+  """
+  if isinstance(plan, PickPlan):
+    plan = plan.lift
+  points = plan.joint_trajectory.points
+  if not points:
+    return None
+  return plan.joint_trajectory.joint_names, points[-1].positions
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# Order detected objects to minimize the estimated travel time of a pick cycle
+#
+
+import math
+
+
+def yaw_difference(a, b):
+  """
+  @returns: absolute angle between two yaws, wrapped to [0, pi]
+  """
+  d = (a - b) % (2 * math.pi)
+  return min(d, 2 * math.pi - d)
+
+
+def fold_yaw(yaw):
+  """
+  The gripper is symmetric under a half turn, so yaw and yaw + pi grasp alike
+  @returns: equivalent yaw in [-pi/2, pi/2)
+  """
+  return (yaw + math.pi / 2) % math.pi - math.pi / 2
+
+
+def travel_time(a, b, linear_speed=0.25, yaw_speed=1.0):
+  """
+  Estimated time between two waypoints; translation and wrist rotation happen together
+  @param: a, b  (x, y, z, yaw), yaw may be None when it does not constrain the move
+  @returns: float, seconds
+  """
+  distance = math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2)
+  rotation = 0.0
+  if a[3] is not None and b[3] is not None:
+    rotation = yaw_difference(a[3], b[3])
+  return max(distance / linear_speed, rotation / yaw_speed)
+
+
+def cost_matrix(points, linear_speed=0.25, yaw_speed=1.0):
+  return [[travel_time(a, b, linear_speed, yaw_speed) for b in points] for a in points]
+
+
+def tour_cost(tour, cost):
+  """
+  @param: tour  Closed tour as a list of indices, starting at the depot, the return leg is implied
+  """
+  return sum(cost[tour[i]][tour[(i + 1) % len(tour)]] for i in range(len(tour)))
+
+
+def nearest_neighbour(cost, start=0):
+  tour = [start]
+  remaining = set(range(len(cost))) - set(tour)
+  while remaining:
+    last = tour[-1]
+    nearest = min(remaining, key=lambda j: (cost[last][j], j))
+    tour.append(nearest)
+    remaining.remove(nearest)
+  return tour
+
+
+def two_opt(tour, cost, max_passes=50):
+  """
+  Reverse tour segments while that shortens the closed tour, keeping tour[0] in place
+  """
+  tour = list(tour)
+  n = len(tour)
+  for _ in range(max_passes):
+    improved = False
+    for i in range(1, n - 1):
+      for j in range(i + 1, n):
+        a, b = tour[i - 1], tour[i]
+        c, d = tour[j], tour[(j + 1) % n]
+        # replace edges a-b and c-d by a-c and b-d
+        delta = cost[a][c] + cost[b][d] - cost[a][b] - cost[c][d]
+        if delta < -1e-9:
+          tour[i:j + 1] = reversed(tour[i:j + 1])
+          improved = True
+    if not improved:
+      break
+  return tour
+
+
+def order_picks(start, targets, linear_speed=0.25, yaw_speed=1.0):
+  """
+  Visiting order of the targets for a cycle that starts and ends at start
+  (the observe pose)
+  @param: start    (x, y, z, yaw), yaw may be None
+  @param: targets  A list of (x, y, z, yaw)
+  @returns: list of indices into targets
+  """
+  if len(targets) < 2:
+    return list(range(len(targets)))
+  cost = cost_matrix([start] + list(targets), linear_speed, yaw_speed)
+  tour = two_opt(nearest_neighbour(cost), cost)
+  return [i - 1 for i in tour[1:]]
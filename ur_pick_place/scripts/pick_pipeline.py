@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Plan-while-executing pipeline for a sequence of MoveIt goals
+#
+
+try:
+  from time import monotonic
+except ImportError:
+  from time import time as monotonic
+
+import rospy
+import actionlib
+from moveit_msgs.msg import ExecuteTrajectoryAction, ExecuteTrajectoryGoal, MoveItErrorCodes
+
+from pick_goals import PlaceGoal, PickPlan, trajectory_end
+
+
+class ExecutionMonitor(object):
+  """Executes trajectories asynchronously through move_group's execute_trajectory
+  action. The action client only reports the result of the goal it sent last, so
+  a late result of a stopped or of a synchronous execution cannot end the wait
+  for the next trajectory."""
+  def __init__(self, action='/execute_trajectory', timeout=10.0):
+    self.error_code = None
+    self.client = actionlib.SimpleActionClient(action, ExecuteTrajectoryAction)
+    if not self.client.wait_for_server(rospy.Duration(timeout)):
+      rospy.logwarn("Action %s is not available" % action)
+
+  def execute(self, plan):
+    self.error_code = None
+    self.client.send_goal(ExecuteTrajectoryGoal(trajectory=plan))
+
+  def stop(self):
+    self.client.cancel_goal()
+
+  def wait(self, timeout=None):
+    """
+    @returns: bool, True if the execution finished successfully within the timeout
+    """
+    if not self.client.wait_for_result(rospy.Duration(timeout or 0)):
+      return False
+    result = self.client.get_result()
+    self.error_code = result.error_code.val if result is not None else None
+    return self.error_code == MoveItErrorCodes.SUCCESS
+
+
+class PickPipeline(object):
+  """Executes a list of goals, planning each goal from the predicted end state of
+  the previous trajectory while that trajectory is still executing. At a pick
+  the gripper confirms the grasp before the lift; a missed grasp is retried
+  and then skipped together with its place goal."""
+  def __init__(self, tutorial, gripper=None, grasp_retries=1, execution_timeout=60.0, monitor=None):
+    """
+    @param: monitor  executes the trajectories, an ExecutionMonitor by default
+    """
+    self.tutorial = tutorial
+    self.gripper = gripper
+    self.grasp_retries = grasp_retries
+    self.execution_timeout = execution_timeout
+    self.monitor = monitor if monitor is not None else ExecutionMonitor()
+
+  def run(self, goals):
+    """
+    @param: goals  A list of Poses, lists of joint values, PickGoals and PlaceGoals
+    @returns: list of bool, whether each goal was reached, for a PickGoal whether
+              the object was grasped
+    """
+    tutorial = self.tutorial
+    move_group = tutorial.move_group
+    trace = tutorial.trace
+    reached = [False] * len(goals)
+    # without place goals the grasp is only verified and the object released after the lift
+    release_after_lift = not any(isinstance(goal, PlaceGoal) for goal in goals)
+    holding = False
+
+    with trace.phase('plan', obj=0):
+      plan = tutorial.plan_to(goals[0]) if goals else None
+    for i in range(len(goals)):
+      next_goal = goals[i + 1] if i + 1 < len(goals) else None
+
+      if isinstance(goals[i], PlaceGoal) and not holding:
+        # nothing to place, go on from where the arm is
+        with trace.phase('replan', obj=i + 1):
+          plan = tutorial.plan_to(next_goal) if next_goal is not None else None
+        continue
+
+      if trajectory_end(plan) is None:
+        rospy.logwarn("No plan found for goal %d, skipping it" % i)
+        with trace.phase('plan', obj=i + 1):
+          plan = tutorial.plan_to(next_goal) if next_goal is not None else None
+        continue
+
+      start = monotonic()
+      self.monitor.execute(plan.approach if isinstance(plan, PickPlan) else plan)
+
+      # overlap planning of the next goal with the current motion
+      next_plan = None
+      if next_goal is not None:
+        with trace.phase('plan', obj=i + 1):
+          next_plan = tutorial.plan_to(next_goal, start=trajectory_end(plan))
+
+      # time the execution is still running after the next plan is ready
+      with trace.phase('execute_wait', obj=i):
+        reached[i] = self.monitor.wait(self.execution_timeout)
+      trace.record('execute', monotonic() - start, obj=i)
+
+      # whether the arm is where the next plan starts
+      moved = reached[i]
+      if moved and isinstance(plan, PickPlan):
+        grasped = self.grasp(i)
+        with trace.phase('lift', obj=i):
+          self.monitor.execute(plan.lift)
+          moved = self.monitor.wait(self.execution_timeout)
+        holding = grasped and not release_after_lift
+        if grasped and release_after_lift:
+          self.release(i)
+        reached[i] = moved and grasped
+      elif moved and isinstance(goals[i], PlaceGoal):
+        self.release(i)
+        holding = False
+
+      if not moved:
+        rospy.logwarn("Execution of goal %d failed, replanning from the current state" % i)
+        self.monitor.stop()
+        move_group.stop()
+        # the next plan started from where this one should have ended
+        if next_goal is not None:
+          with trace.phase('replan', obj=i + 1):
+            next_plan = tutorial.plan_to(next_goal)
+      plan = next_plan
+
+    move_group.stop()
+    return reached
+
+  def release(self, i):
+    if self.gripper is None:
+      return
+    with self.tutorial.trace.phase('release', obj=i):
+      self.gripper.release()
+
+  def grasp(self, i):
+    """
+    Close the gripper at the grasp pose, retrying after a missed grasp
+    @returns: bool, True if the gripper confirmed the grasp
+    """
+    if self.gripper is None:
+      return True
+    for attempt in range(1 + self.grasp_retries):
+      with self.tutorial.trace.phase('grasp', obj=i):
+        if self.gripper.grasp():
+          return True
+      rospy.logwarn("Grasp of goal %d not confirmed (attempt %d)" % (i, attempt + 1))
+      self.gripper.release()
+    return False
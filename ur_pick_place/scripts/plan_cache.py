@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# LRU cache of planned trajectories for repeated MoveIt goals
+#
+
+import copy
+import math
+import os
+import pickle
+from collections import OrderedDict
+from io import BytesIO
+
+import rospy
+import geometry_msgs.msg
+from moveit_msgs.msg import RobotTrajectory, RobotState, Constraints
+from moveit_msgs.srv import GetStateValidity
+from moveit_commander.conversions import pose_to_list
+
+
+def quantize(values, resolution):
+  return tuple(int(round(v / resolution)) for v in values)
+
+
+class TrajectoryCache(object):
+  """Trajectories keyed on the quantized start joint state, the goal and a content
+  hash of the planning scene (SceneMonitor.scene_key). Entries loaded from the
+  persistence file are checked for collisions along the whole path against the
+  current scene before their first reuse."""
+  def __init__(self, group_name, capacity=64, resolution=0.01, file_path=None,
+               max_step=0.02, validity_service='/check_state_validity'):
+    """
+    @param: max_step  largest joint move in rad between two states checked for collisions
+    """
+    self.group_name = group_name
+    self.capacity = capacity
+    self.resolution = resolution
+    self.file_path = file_path
+    self.max_step = max_step
+    self.validity_service = validity_service
+    self._check_validity = None
+
+    # key -> [trajectory, validated]
+    self._entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.load()
+
+  def key(self, start_positions, goal, scene_key):
+    if type(goal) is geometry_msgs.msg.Pose:
+      goal_key = ('pose',) + quantize(pose_to_list(goal), self.resolution)
+    else:
+      goal_key = ('joints',) + quantize(goal, self.resolution)
+    return (quantize(start_positions, self.resolution), goal_key, scene_key)
+
+  def get(self, start_positions, goal, scene_key):
+    """
+    @param: scene_key  hash of the current planning scene, None if it is not known
+    @returns: RobotTrajectory, None if there is no valid cached trajectory
+    """
+    if scene_key is None:
+      self.misses += 1
+      return None
+    key = self.key(start_positions, goal, scene_key)
+    entry = self._entries.get(key)
+    if entry is None:
+      self.misses += 1
+      return None
+    if not entry[1]:
+      if not self.is_collision_free(entry[0]):
+        del self._entries[key]
+        self.misses += 1
+        return None
+      entry[1] = True
+    # most recently used goes last
+    self._entries.pop(key)
+    self._entries[key] = entry
+    self.hits += 1
+    # start exactly at the current state, which may differ from the cached start
+    # by up to the quantization resolution
+    trajectory = copy.deepcopy(entry[0])
+    trajectory.joint_trajectory.points[0].positions = list(start_positions)
+    return trajectory
+
+  def put(self, start_positions, goal, scene_key, trajectory):
+    if scene_key is None or not trajectory.joint_trajectory.points:
+      return
+    # planned in this scene, so it needs no check while the scene is the same
+    key = self.key(start_positions, goal, scene_key)
+    self._entries.pop(key, None)
+    self._entries[key] = [trajectory, True]
+    while len(self._entries) > self.capacity:
+      self._entries.popitem(last=False)
+
+  def clear(self):
+    self._entries.clear()
+
+  def is_collision_free(self, trajectory):
+    """
+    Check every waypoint, and states interpolated between them so that no joint
+    moves more than max_step between two checks, with move_group's state validity
+    service
+    """
+    if self._check_validity is None:
+      try:
+        rospy.wait_for_service(self.validity_service, timeout=1.0)
+      except rospy.ROSException:
+        return False
+      self._check_validity = rospy.ServiceProxy(self.validity_service, GetStateValidity, persistent=True)
+
+    state = RobotState()
+    state.joint_state.name = trajectory.joint_trajectory.joint_names
+    state.is_diff = True
+    try:
+      for positions in self.interpolate(trajectory.joint_trajectory.points):
+        state.joint_state.position = positions
+        if not self._check_validity(state, self.group_name, Constraints()).valid:
+          return False
+    except rospy.ServiceException:
+      self._check_validity = None
+      return False
+    return True
+
+  def interpolate(self, points):
+    """
+    @returns: list of joint positions, the waypoints and the states between them
+    """
+    states = [list(points[0].positions)]
+    for previous, point in zip(points, points[1:]):
+      step = max(abs(b - a) for a, b in zip(previous.positions, point.positions))
+      count = max(1, int(math.ceil(step / self.max_step)))
+      for k in range(1, count + 1):
+        states.append([a + (b - a) * k / float(count)
+                       for a, b in zip(previous.positions, point.positions)])
+    return states
+
+  def load(self):
+    if not self.file_path or not os.path.exists(self.file_path):
+      return
+    try:
+      with open(self.file_path, 'rb') as f:
+        stored = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError) as e:
+      rospy.logwarn("Could not load plan cache %s: %s" % (self.file_path, e))
+      return
+    for key, data in stored:
+      trajectory = RobotTrajectory()
+      trajectory.deserialize(data)
+      self._entries[key] = [trajectory, False]
+    while len(self._entries) > self.capacity:
+      self._entries.popitem(last=False)
+
+  def save(self):
+    if not self.file_path:
+      return
+    stored = []
+    for key, entry in self._entries.items():
+      buff = BytesIO()
+      entry[0].serialize(buff)
+      stored.append((key, buff.getvalue()))
+    directory = os.path.dirname(os.path.abspath(self.file_path))
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    with open(self.file_path, 'wb') as f:
+      pickle.dump(stored, f, protocol=2)
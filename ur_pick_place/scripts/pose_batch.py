@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Batch transformation of detected object poses with NumPy
+#
+
+import numpy as np
+
+from geometry_msgs.msg import Pose
+
+
+def quaternion_matrices(q):
+  """
+  @param: q  (N, 4) array of unit quaternions (x, y, z, w)
+  @returns: (N, 3, 3) array of rotation matrices
+  """
+  x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+  m = np.empty((len(q), 3, 3))
+  m[:, 0, 0] = 1 - 2*(y*y + z*z)
+  m[:, 0, 1] = 2*(x*y - z*w)
+  m[:, 0, 2] = 2*(x*z + y*w)
+  m[:, 1, 0] = 2*(x*y + z*w)
+  m[:, 1, 1] = 1 - 2*(x*x + z*z)
+  m[:, 1, 2] = 2*(y*z - x*w)
+  m[:, 2, 0] = 2*(x*z - y*w)
+  m[:, 2, 1] = 2*(y*z + x*w)
+  m[:, 2, 2] = 1 - 2*(x*x + y*y)
+  return m
+
+
+def quaternion_multiply(q1, q2):
+  """
+  Hamilton product q1 * q2, broadcast over leading dimensions
+  @param: q1  (..., 4) array (x, y, z, w)
+  @param: q2  (..., 4) array (x, y, z, w)
+  @returns: (..., 4) array
+  """
+  x1, y1, z1, w1 = q1[..., 0], q1[..., 1], q1[..., 2], q1[..., 3]
+  x2, y2, z2, w2 = q2[..., 0], q2[..., 1], q2[..., 2], q2[..., 3]
+  return np.stack((w1*x2 + x1*w2 + y1*z2 - z1*y2,
+                   w1*y2 - x1*z2 + y1*w2 + z1*x2,
+                   w1*z2 + x1*y2 - y1*x2 + z1*w2,
+                   w1*w2 - x1*x2 - y1*y2 - z1*z2), axis=-1)
+
+
+def transform_matrix(translation, rotation):
+  """
+  @param: translation  (x, y, z) as returned by TransformListener.lookupTransform
+  @param: rotation     (x, y, z, w)
+  @returns: 4x4 homogeneous matrix
+  """
+  m = np.identity(4)
+  m[:3, :3] = quaternion_matrices(np.asarray([rotation], dtype=float))[0]
+  m[:3, 3] = translation
+  return m
+
+
+def yaw_quaternions(yaw):
+  """
+  @param: yaw  (N,) array of angles about the z axis
+  @returns: (N, 4) array of quaternions
+  """
+  q = np.zeros((len(yaw), 4))
+  q[:, 2] = np.sin(yaw / 2)
+  q[:, 3] = np.cos(yaw / 2)
+  return q
+
+
+def poses_to_arrays(poses, yaw_in_w=False):
+  """
+  @param: poses     A list of Poses
+  @param: yaw_in_w  The poses use the detector's encoding: x = y = z = 0 and
+                    orientation.w holding a yaw angle in radians, counterclockwise
+                    as seen from the camera, i.e. a rotation about the frame's -z axis
+  @returns: (N, 3) positions and (N, 4) unit quaternions
+  """
+  data = np.array([(p.position.x, p.position.y, p.position.z,
+                    p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w)
+                   for p in poses], dtype=float).reshape(-1, 7)
+  positions = data[:, :3]
+  quaternions = data[:, 3:]
+
+  if yaw_in_w:
+    return positions, yaw_quaternions(-quaternions[:, 3])
+  return positions, quaternions / np.linalg.norm(quaternions, axis=1)[:, None]
+
+
+def arrays_to_poses(positions, quaternions):
+  poses = []
+  for position, q in zip(positions.tolist(), quaternions.tolist()):
+    pose = Pose()
+    pose.position.x, pose.position.y, pose.position.z = position
+    pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = q
+    poses.append(pose)
+  return poses
+
+
+def transform_arrays(matrix, rotation, positions, quaternions):
+  """
+  Apply one transform to a batch of poses
+  @param: matrix       4x4 homogeneous matrix of the transform
+  @param: rotation     (x, y, z, w) rotation of the transform
+  @param: positions    (N, 3) array
+  @param: quaternions  (N, 4) array
+  @returns: transformed (N, 3) positions and (N, 4) quaternions
+  """
+  positions = positions.dot(matrix[:3, :3].T) + matrix[:3, 3]
+  quaternions = quaternion_multiply(np.asarray(rotation, dtype=float), quaternions)
+  return positions, quaternions
+
+
+def transform_poses(translation, rotation, poses, yaw_in_w=False):
+  """
+  @param: translation  (x, y, z) of the source frame in the target frame
+  @param: rotation     (x, y, z, w) of the source frame in the target frame
+  @param: poses        A list of Poses in the source frame
+  @param: yaw_in_w     The poses carry a yaw angle in orientation.w, see poses_to_arrays()
+  @returns: list of Poses in the target frame
+  """
+  if not poses:
+    return []
+  positions, quaternions = poses_to_arrays(poses, yaw_in_w)
+  positions, quaternions = transform_arrays(transform_matrix(translation, rotation), rotation,
+                                            positions, quaternions)
+  return arrays_to_poses(positions, quaternions)
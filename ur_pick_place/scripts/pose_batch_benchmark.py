@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Micro-benchmark of the per-pose tf transformation transf_pose_arr used before
+# against the batched one. Runs without a ROS master: the transform is set
+# directly on a tf.TransformerROS instead of being received on /tf.
+#
+# usage: pose_batch_benchmark.py [number of poses ...]
+#
+
+import sys
+import timeit
+
+import numpy as np
+import rospy
+import tf
+from geometry_msgs.msg import Pose, PoseStamped, TransformStamped
+
+from pose_batch import transform_poses
+
+# camera_depth_optical_frame in base_link at the observe pose
+TRANSLATION = (0.462, 0.133, 0.561)
+ROTATION = (0.707, -0.707, 0.0, 0.0)
+
+
+def make_transformer():
+  transformer = tf.TransformerROS(True, rospy.Duration(10.0))
+  transform = TransformStamped()
+  transform.header.frame_id = 'base_link'
+  transform.child_frame_id = 'camera_depth_optical_frame'
+  t, r = transform.transform.translation, transform.transform.rotation
+  t.x, t.y, t.z = TRANSLATION
+  r.x, r.y, r.z, r.w = ROTATION
+  transformer.setTransform(transform)
+  return transformer
+
+
+def random_poses(count):
+  poses = []
+  for _ in range(count):
+    pose = Pose()
+    pose.position.x, pose.position.y = np.random.uniform(-0.2, 0.2, 2)
+    pose.position.z = np.random.uniform(0.4, 0.6)
+    # detector output: yaw angle in orientation.w
+    pose.orientation.w = np.random.uniform(-np.pi, np.pi)
+    poses.append(pose)
+  return poses
+
+
+def transform_each(transformer, poses):
+  # transf_pose_arr before the batch transform: one transformPose per pose
+  result = []
+  pose = PoseStamped()
+  pose.header.frame_id = 'camera_depth_optical_frame'
+  for p in poses:
+    pose.pose = p
+    tf_pose = transformer.transformPose('base_link', pose)
+    tf_pose.pose.orientation.w = p.orientation.w
+    result.append(tf_pose.pose)
+  return result
+
+
+def transform_batch(transformer, poses):
+  # one lookup per detection, as transf_pose_arr does now
+  translation, rotation = transformer.lookupTransform('base_link', 'camera_depth_optical_frame', rospy.Time(0))
+  return transform_poses(translation, rotation, poses, yaw_in_w=True)
+
+
+def main(counts):
+  transformer = make_transformer()
+  print("%8s %14s %14s %8s" % ("poses", "tf [us]", "batch [us]", "speedup"))
+  for count in counts:
+    poses = random_poses(count)
+    number = max(10, 20000 // count)
+    each = min(timeit.repeat(lambda: transform_each(transformer, poses), number=number, repeat=5)) / number
+    batch = min(timeit.repeat(lambda: transform_batch(transformer, poses), number=number, repeat=5)) / number
+    print("%8d %14.1f %14.1f %7.1fx" % (count, each * 1e6, batch * 1e6, each / batch))
+
+
+if __name__ == '__main__':
+  main([int(a) for a in sys.argv[1:]] or [1, 5, 10, 25, 50, 100])
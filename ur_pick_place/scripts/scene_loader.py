@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+#
+# Collision objects from YAML configs and Gazebo SDF worlds
+#
+
+import os
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import yaml
+import rospy
+import rospkg
+from geometry_msgs.msg import Pose, Point
+from moveit_msgs.msg import CollisionObject
+from shape_msgs.msg import SolidPrimitive, Mesh, MeshTriangle
+from tf.transformations import euler_matrix, quaternion_from_matrix
+
+from scene_monitor import remove_object
+
+try:
+  import pyassimp
+except ImportError:
+  pyassimp = None
+
+
+def pose_matrix(values):
+  """
+  @param: values  [x, y, z, roll, pitch, yaw], missing values are 0
+  @returns: 4x4 homogeneous matrix
+  """
+  values = (list(values) + [0.0] * 6)[:6]
+  matrix = euler_matrix(values[3], values[4], values[5])
+  matrix[:3, 3] = values[:3]
+  return matrix
+
+
+def matrix_to_pose(matrix):
+  pose = Pose()
+  pose.position.x, pose.position.y, pose.position.z = matrix[:3, 3]
+  q = quaternion_from_matrix(matrix)
+  pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = q
+  return pose
+
+
+def sdf_pose(element):
+  """
+  @returns: 4x4 matrix of the <pose> child of element, identity if there is none
+  """
+  pose = element.find('pose')
+  if pose is None or not pose.text:
+    return pose_matrix([])
+  return pose_matrix([float(v) for v in pose.text.split()])
+
+
+def sdf_values(element, tag, default=None):
+  child = element.find(tag)
+  if child is None or not child.text:
+    return default
+  return [float(v) for v in child.text.split()]
+
+
+class SceneLoader(object):
+  """Name-indexed registry of collision objects read from YAML scene configs and
+  SDF worlds. Objects are sent to move_group in one planning scene diff by apply()."""
+  def __init__(self, scene_monitor, frame_id='world', model_paths=None):
+    """
+    @param: model_paths  directories searched for model:// uris, defaults to the
+                         package models and GAZEBO_MODEL_PATH
+    """
+    self.scene_monitor = scene_monitor
+    self.frame_id = frame_id
+    self.rospack = rospkg.RosPack()
+    if model_paths is None:
+      model_paths = [os.path.join(self.rospack.get_path('ur5_pick_place'), 'models')]
+      model_paths += [p for p in os.environ.get('GAZEBO_MODEL_PATH', '').split(':') if p]
+    self.model_paths = model_paths
+
+    self.objects = OrderedDict()
+    self._meshes = {}
+
+  def resolve_uri(self, uri):
+    """
+    @returns: file path of a package://, model:// or file:// uri, None if it cannot be found
+    """
+    if uri.startswith('package://'):
+      package, _, path = uri[len('package://'):].partition('/')
+      return os.path.join(self.rospack.get_path(package), path)
+    if uri.startswith('model://'):
+      path = uri[len('model://'):]
+      for directory in self.model_paths:
+        candidate = os.path.join(directory, path)
+        if os.path.exists(candidate):
+          return candidate
+      return None
+    if uri.startswith('file://'):
+      return uri[len('file://'):]
+    return uri
+
+  def load_mesh(self, uri, scale=(1, 1, 1)):
+    """
+    @returns: shape_msgs/Mesh, None if the mesh cannot be loaded. Meshes are loaded
+              once per file and scale.
+    """
+    key = (uri, tuple(scale))
+    if key in self._meshes:
+      return self._meshes[key]
+    path = self.resolve_uri(uri)
+    if pyassimp is None or path is None:
+      rospy.logwarn("Cannot load mesh %s%s" % (uri, " (pyassimp is not installed)" if pyassimp is None else ""))
+      return None
+
+    mesh = Mesh()
+    scene = pyassimp.load(path)
+    try:
+      # all sub-meshes of the file in one mesh
+      for sub_mesh in scene.meshes:
+        first = len(mesh.vertices)
+        for face in sub_mesh.faces:
+          indices = face.indices if hasattr(face, 'indices') else face
+          if len(indices) == 3:
+            triangle = MeshTriangle()
+            triangle.vertex_indices = [first + int(i) for i in indices]
+            mesh.triangles.append(triangle)
+        for vertex in sub_mesh.vertices:
+          mesh.vertices.append(Point(vertex[0] * scale[0], vertex[1] * scale[1], vertex[2] * scale[2]))
+    finally:
+      pyassimp.release(scene)
+    self._meshes[key] = mesh
+    return mesh
+
+  def add_shape(self, obj, shape, pose):
+    """
+    Append a SolidPrimitive or Mesh at pose to a CollisionObject
+    """
+    if isinstance(shape, Mesh):
+      obj.meshes.append(shape)
+      obj.mesh_poses.append(pose)
+    else:
+      obj.primitives.append(shape)
+      obj.primitive_poses.append(pose)
+
+  def add(self, obj):
+    obj.header.frame_id = obj.header.frame_id or self.frame_id
+    obj.operation = CollisionObject.ADD
+    self.objects[obj.id] = obj
+    return obj
+
+  def remove(self, names):
+    """
+    Remove objects from the registry and the planning scene
+    @returns: bool, True if move_group applied the change
+    """
+    for name in names:
+      self.objects.pop(name, None)
+    return self.scene_monitor.apply([remove_object(name) for name in names])
+
+  def apply(self, names=None):
+    """
+    Send the registered objects, or the given ones, in one planning scene diff
+    @returns: bool, True if move_group applied the diff
+    """
+    if names is None:
+      names = list(self.objects)
+    return self.scene_monitor.apply([self.objects[name] for name in names])
+
+  def primitive(self, description):
+    shape_type = description.get('type', 'box')
+    if shape_type == 'mesh':
+      return self.load_mesh(description['mesh'], description.get('scale', (1, 1, 1)))
+    primitive = SolidPrimitive()
+    if shape_type == 'box':
+      primitive.type = SolidPrimitive.BOX
+      primitive.dimensions = list(description['size'])
+    elif shape_type == 'cylinder':
+      primitive.type = SolidPrimitive.CYLINDER
+      primitive.dimensions = [description['height'], description['radius']]
+    elif shape_type == 'sphere':
+      primitive.type = SolidPrimitive.SPHERE
+      primitive.dimensions = [description['radius']]
+    else:
+      raise ValueError("Unknown collision shape type: %s" % shape_type)
+    return primitive
+
+  def load_yaml(self, file_path):
+    """
+    Register the objects of a scene config, see config/scene.yaml
+    @returns: list of the registered names
+    """
+    with open(file_path) as f:
+      config = yaml.safe_load(f) or {}
+    frame_id = config.get('frame_id', self.frame_id)
+    names = []
+    for name, description in (config.get('objects') or {}).items():
+      shape = self.primitive(description)
+      if shape is None:
+        continue
+      obj = CollisionObject()
+      obj.id = name
+      obj.header.frame_id = frame_id
+      self.add_shape(obj, shape, matrix_to_pose(pose_matrix(description.get('pose', []))))
+      self.add(obj)
+      names.append(name)
+    return names
+
+  def sdf_shape(self, geometry):
+    """
+    @returns: SolidPrimitive or Mesh of an SDF <geometry>, None for planes and unsupported shapes
+    """
+    if geometry.find('box') is not None:
+      return self.primitive({'type': 'box', 'size': sdf_values(geometry.find('box'), 'size')})
+    if geometry.find('cylinder') is not None:
+      cylinder = geometry.find('cylinder')
+      return self.primitive({'type': 'cylinder', 'height': sdf_values(cylinder, 'length')[0],
+                             'radius': sdf_values(cylinder, 'radius')[0]})
+    if geometry.find('sphere') is not None:
+      return self.primitive({'type': 'sphere', 'radius': sdf_values(geometry.find('sphere'), 'radius')[0]})
+    if geometry.find('mesh') is not None:
+      mesh = geometry.find('mesh')
+      return self.load_mesh(mesh.find('uri').text.strip(), sdf_values(mesh, 'scale', [1, 1, 1]))
+    return None
+
+  def model_object(self, name, model, model_matrix):
+    """
+    @returns: CollisionObject with the collision geometry of all links of an SDF <model>
+    """
+    obj = CollisionObject()
+    obj.id = name
+    obj.header.frame_id = self.frame_id
+    for link in model.findall('link'):
+      link_matrix = model_matrix.dot(sdf_pose(link))
+      for collision in link.findall('collision'):
+        geometry = collision.find('geometry')
+        shape = self.sdf_shape(geometry) if geometry is not None else None
+        if shape is not None:
+          self.add_shape(obj, shape, matrix_to_pose(link_matrix.dot(sdf_pose(collision))))
+    return obj
+
+  def load_world(self, file_path, origin=(0, 0, 0), static_only=True, exclude=()):
+    """
+    Register the models of a Gazebo world, one collision object per model
+    @param: origin       [x, y, z, roll, pitch, yaw] of frame_id in the Gazebo world, e.g.
+                         the spawn pose of the robot
+    @param: static_only  skip models that are not static, i.e. the objects to pick
+    @param: exclude      model names to skip
+    @returns: list of the registered names
+    """
+    world = ET.parse(file_path).getroot().find('world')
+    to_frame = pose_matrix(origin)
+    to_frame[:3, :3] = to_frame[:3, :3].T
+    to_frame[:3, 3] = -to_frame[:3, :3].dot(to_frame[:3, 3])
+
+    models = [(model.get('name'), model, sdf_pose(model)) for model in world.findall('model')]
+    for include in world.findall('include'):
+      path = self.resolve_uri(include.find('uri').text.strip())
+      if path is None or not os.path.exists(os.path.join(path, 'model.sdf')):
+        continue
+      model = ET.parse(os.path.join(path, 'model.sdf')).getroot().find('model')
+      name = include.find('name')
+      # the static flag of the include replaces the one in the model file
+      static = include.find('static')
+      if static is not None:
+        for own in model.findall('static'):
+          model.remove(own)
+        model.append(static)
+      # the pose of the include replaces the pose in the model file
+      pose = sdf_pose(include) if include.find('pose') is not None else sdf_pose(model)
+      models.append((name.text.strip() if name is not None else model.get('name'), model, pose))
+
+    names = []
+    for name, model, pose in models:
+      static = model.find('static')
+      is_static = static is not None and static.text.strip() in ('1', 'true')
+      if name in exclude or (static_only and not is_static):
+        continue
+      obj = self.model_object(name, model, to_frame.dot(pose))
+      if obj.primitives or obj.meshes:
+        self.add(obj)
+        names.append(name)
+    return names
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#
+# Event-driven planning scene updates and waits
+#
+
+import copy
+import hashlib
+import threading
+import time
+from io import BytesIO
+
+import rospy
+from moveit_msgs.msg import PlanningScene, PlanningSceneComponents, CollisionObject, AttachedCollisionObject
+from moveit_msgs.srv import ApplyPlanningScene, GetPlanningScene
+from shape_msgs.msg import SolidPrimitive
+
+
+def make_box(name, pose_stamped, size):
+  """
+  @param: pose_stamped  PoseStamped of the box center
+  @param: size          (x, y, z) edge lengths
+  @returns: CollisionObject adding the box
+  """
+  box = CollisionObject()
+  box.id = name
+  box.header = pose_stamped.header
+  box.operation = CollisionObject.ADD
+  primitive = SolidPrimitive()
+  primitive.type = SolidPrimitive.BOX
+  primitive.dimensions = list(size)
+  box.primitives = [primitive]
+  box.primitive_poses = [pose_stamped.pose]
+  return box
+
+
+def remove_object(name):
+  obj = CollisionObject()
+  obj.id = name
+  obj.operation = CollisionObject.REMOVE
+  return obj
+
+
+def attach_object(link_name, name, touch_links=()):
+  """
+  @returns: AttachedCollisionObject attaching the existing world object name to link_name
+  """
+  attached = AttachedCollisionObject()
+  attached.link_name = link_name
+  attached.object.id = name
+  attached.object.operation = CollisionObject.ADD
+  attached.touch_links = list(touch_links)
+  return attached
+
+
+def detach_object(link_name, name):
+  attached = AttachedCollisionObject()
+  attached.link_name = link_name
+  attached.object.id = name
+  attached.object.operation = CollisionObject.REMOVE
+  return attached
+
+
+class SceneMonitor(object):
+  """Applies planning scene changes synchronously through move_group's
+  apply_planning_scene service and waits for scene changes on the monitored
+  planning scene topic instead of polling move_group. The world and attached
+  object names are queried once and then kept up to date from the diffs."""
+  def __init__(self, scene_topic='/move_group/monitored_planning_scene',
+               apply_service='/apply_planning_scene', get_service='/get_planning_scene'):
+    self.apply_service = apply_service
+    self.get_service = get_service
+    self._apply_scene = None
+    self._get_scene = None
+
+    self._changed = threading.Condition()
+    self._updates = 0
+    # content hash of the world geometry, cleared when it changes
+    self._geometry_updates = 0
+    self._scene_key = None
+    # object names from the diffs, None until queried and after a full scene
+    self._known = None
+    self._attached = None
+    self._object_updates = 0
+    self._scene_sub = rospy.Subscriber(scene_topic, PlanningScene, self._scene_callback, queue_size=10)
+
+  def _scene_callback(self, msg):
+    with self._changed:
+      self._updates += 1
+      # most updates are robot state diffs that leave the geometry as it is
+      if (not msg.is_diff or msg.world.collision_objects or msg.world.octomap.octomap.data
+          or msg.robot_state.attached_collision_objects):
+        self._geometry_changed()
+      self._update_objects(msg)
+      self._changed.notify_all()
+
+  def _update_objects(self, msg):
+    if not msg.is_diff:
+      # resynchronized by the next objects() call
+      self._known = None
+      self._attached = None
+      return
+    if not (msg.world.collision_objects or msg.robot_state.attached_collision_objects):
+      return
+    self._object_updates += 1
+    if self._known is None:
+      return
+    for obj in msg.world.collision_objects:
+      if obj.operation == CollisionObject.REMOVE:
+        if obj.id:
+          self._known.discard(obj.id)
+        else:
+          # an empty id removes every world object
+          self._known.clear()
+      else:
+        self._known.add(obj.id)
+    for attached in msg.robot_state.attached_collision_objects:
+      name = attached.object.id
+      if attached.object.operation == CollisionObject.REMOVE:
+        if name:
+          self._attached.discard(name)
+        else:
+          self._attached.clear()
+      else:
+        # an attached object leaves the world
+        self._attached.add(name)
+        self._known.discard(name)
+
+  def _geometry_changed(self):
+    self._geometry_updates += 1
+    self._scene_key = None
+
+  def _proxy(self, name, service_class):
+    rospy.wait_for_service(name, timeout=5.0)
+    return rospy.ServiceProxy(name, service_class, persistent=True)
+
+  def apply(self, collision_objects=(), attached_objects=()):
+    """
+    Apply all changes in one planning scene diff
+    @returns: bool, True if move_group applied the diff
+    """
+    scene = PlanningScene()
+    scene.is_diff = True
+    scene.robot_state.is_diff = True
+    scene.world.collision_objects = list(collision_objects)
+    scene.robot_state.attached_collision_objects = list(attached_objects)
+    try:
+      if self._apply_scene is None:
+        self._apply_scene = self._proxy(self.apply_service, ApplyPlanningScene)
+      success = self._apply_scene(scene).success
+      with self._changed:
+        self._geometry_changed()
+      return success
+    except (rospy.ROSException, rospy.ServiceException) as e:
+      self._apply_scene = None
+      rospy.logwarn("Could not apply planning scene: %s" % e)
+      return False
+
+  def get_scene(self, components):
+    """
+    @param: components  PlanningSceneComponents bits
+    @returns: PlanningScene, None if move_group cannot be reached
+    """
+    request = PlanningSceneComponents()
+    request.components = components
+    try:
+      if self._get_scene is None:
+        self._get_scene = self._proxy(self.get_service, GetPlanningScene)
+      return self._get_scene(request).scene
+    except (rospy.ROSException, rospy.ServiceException) as e:
+      self._get_scene = None
+      rospy.logwarn("Could not get planning scene: %s" % e)
+      return None
+
+  def scene_key(self):
+    """
+    Content hash of the world objects, the octomap and the attached objects. It is
+    the same in every run for the same scene, including changes made by other
+    nodes, and is only recomputed after move_group reported a geometry change.
+    @returns: str, None if the scene cannot be read
+    """
+    with self._changed:
+      if self._scene_key is not None:
+        return self._scene_key
+      geometry_updates = self._geometry_updates
+    scene = self.get_scene(PlanningSceneComponents.WORLD_OBJECT_GEOMETRY |
+                           PlanningSceneComponents.OCTOMAP |
+                           PlanningSceneComponents.ROBOT_STATE_ATTACHED_OBJECTS)
+    if scene is None:
+      return None
+
+    digest = hashlib.sha1()
+    def update(msg, header):
+      # stamps differ between runs, the geometry does not
+      header.stamp = rospy.Time(0)
+      buff = BytesIO()
+      msg.serialize(buff)
+      digest.update(buff.getvalue())
+    for obj in sorted(scene.world.collision_objects, key=lambda o: o.id):
+      obj = copy.deepcopy(obj)
+      update(obj, obj.header)
+    octomap = copy.deepcopy(scene.world.octomap)
+    update(octomap, octomap.header)
+    for attached in sorted(scene.robot_state.attached_collision_objects, key=lambda o: o.object.id):
+      attached = copy.deepcopy(attached)
+      update(attached, attached.object.header)
+    key = digest.hexdigest()
+
+    with self._changed:
+      # a change that arrived while the scene was read is not in this hash
+      if self._geometry_updates == geometry_updates:
+        self._scene_key = key
+    return key
+
+  def objects(self):
+    """
+    Object names as tracked from the diffs; move_group is only queried before the
+    first diff and after a full scene
+    @returns: (set of world object ids, set of attached object ids)
+    """
+    while not rospy.is_shutdown():
+      with self._changed:
+        if self._known is not None:
+          return set(self._known), set(self._attached)
+        object_updates = self._object_updates
+      scene = self.get_scene(PlanningSceneComponents.WORLD_OBJECT_NAMES |
+                             PlanningSceneComponents.ROBOT_STATE_ATTACHED_OBJECTS)
+      if scene is None:
+        return set(), set()
+      known = set(o.id for o in scene.world.collision_objects)
+      attached = set(o.object.id for o in scene.robot_state.attached_collision_objects)
+      with self._changed:
+        # a diff that arrived during the query may be missing from it, query again
+        if self._object_updates == object_updates:
+          self._known, self._attached = known, attached
+          return set(known), set(attached)
+    return set(), set()
+
+  def wait_for(self, name, known=False, attached=False, timeout=4):
+    """
+    Wait until the object is (not) in the world and (not) attached, checked again
+    whenever move_group publishes a change
+    @returns: bool, False on timeout
+    """
+    deadline = time.time() + timeout
+    with self._changed:
+      seen = self._updates
+    while not rospy.is_shutdown():
+      world_objects, attached_objects = self.objects()
+      if (name in world_objects) == known and (name in attached_objects) == attached:
+        return True
+      with self._changed:
+        while self._updates == seen:
+          remaining = deadline - time.time()
+          if remaining <= 0 or rospy.is_shutdown():
+            return False
+          self._changed.wait(remaining)
+        seen = self._updates
+    return False
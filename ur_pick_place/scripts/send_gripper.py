@@ -4,31 +4,153 @@
 #
 
 import argparse
+import sys
+import threading
 
 import rospy
 import actionlib
 import control_msgs.msg
 
 
-def gripper_client(value):
+class GripperFuture(object):
+    """Result of a gripper command that is still running"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._callbacks = []
+        # actionlib GoalStatus of the finished goal, None if it timed out or was replaced
+        self.state = None
+        self.timed_out = False
+        self._result = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        @returns: GripperCommandResult, None if the command did not finish in time
+        """
+        self._done.wait(timeout)
+        return self._result
+
+    def add_done_callback(self, fn):
+        """
+        fn(future) is called when the command finishes, right away if it already has
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set(self, state, result, timed_out=False):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self.state = state
+            self._result = result
+            self.timed_out = timed_out
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class GripperClient(object):
+    """Connects once to the gripper action server and sends commands over the same
+    action client. A new command replaces the one still running."""
+    def __init__(self, action='/gripper_controller/gripper_cmd'):
+        self.client = actionlib.SimpleActionClient(
+            action,  # namespace of the action topics
+            control_msgs.msg.GripperCommandAction # action type
+        )
+        self._connected = False
+        self._pending = None
+
+    def connect(self, timeout=None):
+        """
+        Wait until the action server has been started and is listening for goals
+        @returns: bool, False if it did not connect within the timeout
+        """
+        if not self._connected:
+            self._connected = self.client.wait_for_server(rospy.Duration(timeout or 0))
+        return self._connected
+
+    def send_async(self, value, max_effort=-1.0, done_cb=None, timeout=None):
+        """
+        @param: value    From 0.0 (open) to 0.8 (closed)
+        @param: done_cb  called with the future when the command finishes
+        @param: timeout  seconds after which the goal is cancelled
+        @returns: GripperFuture
+        """
+        self.connect(timeout)
+        if self._pending is not None:
+            # the simple action client only tracks the latest goal
+            self._pending._set(None, None)
+
+        future = GripperFuture()
+        if done_cb is not None:
+            future.add_done_callback(done_cb)
+        self._pending = future
 
-    # Create an action client
-    client = actionlib.SimpleActionClient(
-        '/gripper_controller/gripper_cmd',  # namespace of the action topics
-        control_msgs.msg.GripperCommandAction # action type
-    )
-    
-    # Wait until the action server has been started and is listening for goals
-    client.wait_for_server()
+        goal = control_msgs.msg.GripperCommandGoal()
+        goal.command.position = value
+        goal.command.max_effort = max_effort  # -1.0: do not limit the effort
+        self.client.send_goal(goal, done_cb=lambda state, result: future._set(state, result))
 
-    # Create a goal to send (to the action server)
-    goal = control_msgs.msg.GripperCommandGoal()
-    goal.command.position = value   # From 0.0 to 0.8
-    goal.command.max_effort = -1.0  # Do not limit the effort
-    client.send_goal(goal)
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._cancel, [future])
+            timer.daemon = True
+            timer.start()
+            future.add_done_callback(lambda f: timer.cancel())
+        return future
 
-    client.wait_for_result()
-    return client.get_result()
+    def send(self, value, max_effort=-1.0, timeout=None):
+        """
+        @returns: GripperCommandResult, None if the command did not finish within the timeout
+        """
+        return self.send_async(value, max_effort, timeout=timeout).result()
+
+    def _cancel(self, future):
+        if future is self._pending and not future.done():
+            self.client.cancel_goal()
+            future._set(None, None, timed_out=True)
+
+
+_client = None
+
+
+def gripper_client(value):
+    # one connection per process, created on first use
+    global _client
+    if _client is None:
+        _client = GripperClient()
+    return _client.send(value)
+
+
+def run_stdin(client, timeout):
+    """
+    Send one command per line of stdin: a value between 0.0 and 0.8, `open` or `close`
+    """
+    named = {'open': 0.0, 'close': 0.8}
+    for line in iter(sys.stdin.readline, ''):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            value = named[line] if line in named else float(line)
+        except ValueError:
+            print("invalid command: %s" % line)
+            continue
+        result = client.send(value, timeout=timeout)
+        if result is None:
+            print("%s: no result" % line)
+        else:
+            print("%s: position %.3f effort %.3f stalled %s reached %s" % (
+                line, result.position, result.effort, result.stalled, result.reached_goal))
+        sys.stdout.flush()
+        if rospy.is_shutdown():
+            break
 
 
 if __name__ == '__main__':
@@ -37,12 +159,20 @@ if __name__ == '__main__':
         parser = argparse.ArgumentParser()
         parser.add_argument("--value", type=float, default="0.2",
                             help="Value betwewen 0.0 (open) and 0.8 (closed)")
-        args = parser.parse_args()
+        parser.add_argument("--stdin", action="store_true",
+                            help="Read one value, open or close per line from stdin")
+        parser.add_argument("--timeout", type=float, default=None,
+                            help="Seconds to wait for each command")
+        args = parser.parse_args(rospy.myargv()[1:])
         gripper_value = args.value
         # Start the ROS node
         rospy.init_node('gripper_command')
-        # Set the value to the gripper
-        result = gripper_client(gripper_value)
-        
+        client = GripperClient()
+        if args.stdin:
+            run_stdin(client, args.timeout)
+        else:
+            # Set the value to the gripper
+            result = client.send(gripper_value, timeout=args.timeout)
+
     except rospy.ROSInterruptException:
         print ("Program interrupted before completion")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Offline estimate of the pick-and-place throughput over random object layouts.
+# Runs without ROS: kinematics and timing come from ur5_kinematics, and the
+# layouts are simulated in batches of one robot each. With pipeline set to 1
+# every layout runs through the node's PickPipeline instead, which needs the
+# rospy, actionlib and moveit_msgs Python modules but no ROS master.
+#
+# usage: ur5_cycle_sim.py [layouts] [objects per layout] [velocity scaling] [pipeline]
+#
+
+import math
+import sys
+import time
+
+import numpy as np
+
+from pick_goals import PickGoal
+from pick_order import order_picks
+from ur5_kinematics import HeadlessMoveGroup, HeadlessExecutionMonitor, HeadlessGripper, forward
+
+# observe_goal of ur5_pick_place.py, where each cycle starts and ends
+OBSERVE_GOAL = [-0.27640452940659355, -1.5613947841166143, 0.8086120509001136,
+                -0.8173772811698496, -1.5702185440399328, -0.2754254250487067]
+# pre-grasp height and the table area seen from the observe pose
+PICK_HEIGHT = 0.18
+X_RANGE = (0.25, 0.55)
+Y_RANGE = (-0.25, 0.25)
+
+
+def random_layouts(layouts, count):
+  """
+  @returns: (layouts, count, 4) array of (x, y, z, yaw) pre-grasp targets
+  """
+  targets = np.empty((layouts, count, 4))
+  targets[..., 0] = np.random.uniform(X_RANGE[0], X_RANGE[1], (layouts, count))
+  targets[..., 1] = np.random.uniform(Y_RANGE[0], Y_RANGE[1], (layouts, count))
+  targets[..., 2] = PICK_HEIGHT
+  targets[..., 3] = np.random.uniform(-math.pi, math.pi, (layouts, count))
+  return targets
+
+
+def simulate_cycles(targets, velocity_scaling=1.0):
+  """
+  One robot per layout picks every target in the planned order and returns to
+  the observe pose; all layouts are simulated together
+  @param: targets  (layouts, count, 4) array as returned by random_layouts()
+  @returns: (cycle times in simulated seconds, picked objects per layout, robot)
+  """
+  robot = HeadlessMoveGroup(np.tile(OBSERVE_GOAL, (len(targets), 1)), velocity_scaling=velocity_scaling)
+  position = forward(OBSERVE_GOAL)[:3, 3]
+  start = (position[0], position[1], position[2], None)
+  ordered = np.array([layout[order_picks(start, [tuple(t) for t in layout])] for layout in targets])
+
+  picked = np.zeros(len(targets), dtype=int)
+  for k in range(ordered.shape[1]):
+    picked += robot.pick(*np.moveaxis(ordered[:, k], -1, 0))
+  robot.go_to_joint_state(OBSERVE_GOAL)
+  return robot.clock, picked, robot
+
+
+def simulate_pipeline(targets, velocity_scaling=1.0):
+  """
+  One robot per layout runs the pick goals and the return to the observe pose
+  through PickPipeline, one layout after the other
+  @param: targets  (layouts, count, 4) array as returned by random_layouts()
+  @returns: (cycle times in simulated seconds, picked objects per layout, last robot)
+  """
+  from pick_pipeline import PickPipeline
+
+  position = forward(OBSERVE_GOAL)[:3, 3]
+  start = (position[0], position[1], position[2], None)
+  clock = np.zeros(len(targets))
+  picked = np.zeros(len(targets), dtype=int)
+  phases = {}
+  for n, layout in enumerate(targets):
+    robot = HeadlessMoveGroup(OBSERVE_GOAL, velocity_scaling=velocity_scaling)
+    pipeline = PickPipeline(robot, gripper=HeadlessGripper(robot), monitor=HeadlessExecutionMonitor(robot))
+    goals = [PickGoal(*layout[i]) for i in order_picks(start, [tuple(t) for t in layout])]
+    reached = pipeline.run(goals + [OBSERVE_GOAL])
+    clock[n] = robot.clock
+    picked[n] = sum(reached[:-1])
+    for name, total in robot.phases.items():
+      phases[name] = phases.get(name, 0.0) + total
+  robot.phases = phases
+  return clock, picked, robot
+
+
+def main(layouts, objects, velocity_scaling, batch=1000, pipeline=False):
+  simulate = simulate_pipeline if pipeline else simulate_cycles
+  cycles = []
+  picked = 0
+  phases = {}
+  wall = time.time()
+  for first in range(0, layouts, batch):
+    clock, count, robot = simulate(random_layouts(min(batch, layouts - first), objects), velocity_scaling)
+    cycles.append(clock)
+    picked += count.sum()
+    for name, total in robot.phases.items():
+      phases[name] = phases.get(name, 0.0) + total
+  wall = time.time() - wall
+
+  cycles = np.sort(np.concatenate(cycles))
+  print("%d layouts of %d objects in %.2f s (%.0f layouts/s)" % (layouts, objects, wall, layouts / wall))
+  print("cycle time [s]: mean %.2f  p50 %.2f  p95 %.2f  max %.2f" % (
+      cycles.mean(), np.percentile(cycles, 50), np.percentile(cycles, 95), cycles[-1]))
+  print("picks per minute: %.1f, out of reach: %d of %d" % (
+      60.0 * picked / cycles.sum(), layouts * objects - picked, layouts * objects))
+  for name in ('approach', 'descend', 'grasp', 'lift', 'execute'):
+    print("%-10s %6.1f%%" % (name, 100.0 * phases.get(name, 0.0) / cycles.sum()))
+
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  main(int(args[0]) if len(args) > 0 else 1000,
+       int(args[1]) if len(args) > 1 else 5,
+       float(args[2]) if len(args) > 2 else 1.0,
+       pipeline=len(args) > 3 and args[3] == '1')
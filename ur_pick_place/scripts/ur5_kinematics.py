@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+#
+# UR5 kinematics and trajectory timing with NumPy, without move_group, Gazebo or TF
+#
+
+import math
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from pick_goals import PickGoal, PlaceGoal, PickPlan
+from pick_order import fold_yaw
+
+# DH parameters of the ur5 in ur_description, the arm of ur5_cam_robot.urdf.xacro
+D1 = 0.089159
+A2 = -0.42500
+A3 = -0.39225
+D4 = 0.10915
+D5 = 0.09465
+D6 = 0.0823
+DH_A = (0.0, A2, A3, 0.0, 0.0, 0.0)
+DH_D = (D1, 0.0, 0.0, D4, D5, D6)
+DH_ALPHA = (math.pi / 2, 0.0, 0.0, math.pi / 2, -math.pi / 2, 0.0)
+
+JOINT_NAMES = ['shoulder_pan_joint', 'shoulder_lift_joint', 'elbow_joint',
+               'wrist_1_joint', 'wrist_2_joint', 'wrist_3_joint']
+# joint_limited="false": every joint turns +-2pi, at up to 3.15 rad/s
+JOINT_LIMIT = 2 * math.pi
+MAX_VELOCITY = 3.15
+# the time parameterization's default when no acceleration limit is configured
+MAX_ACCELERATION = 1.0
+
+# base_link is the DH base frame turned by pi about z, and ee_link points its
+# x axis out of the flange where the DH tool frame points z
+BASE_LINK = np.diag([-1.0, -1.0, 1.0, 1.0])
+EE_LINK = np.array([[0.0, -1.0, 0.0, 0.0],
+                    [0.0, 0.0, -1.0, 0.0],
+                    [1.0, 0.0, 0.0, 0.0],
+                    [0.0, 0.0, 0.0, 1.0]])
+
+
+def dh_matrices(i, theta):
+  """
+  @param: i      joint index
+  @param: theta  (...) array of joint values
+  @returns: (..., 4, 4) transforms from frame i to frame i + 1
+  """
+  theta = np.asarray(theta, dtype=float)
+  ct, st = np.cos(theta), np.sin(theta)
+  ca, sa = math.cos(DH_ALPHA[i]), math.sin(DH_ALPHA[i])
+  m = np.zeros(theta.shape + (4, 4))
+  m[..., 0, 0] = ct
+  m[..., 0, 1] = -st * ca
+  m[..., 0, 2] = st * sa
+  m[..., 0, 3] = DH_A[i] * ct
+  m[..., 1, 0] = st
+  m[..., 1, 1] = ct * ca
+  m[..., 1, 2] = -ct * sa
+  m[..., 1, 3] = DH_A[i] * st
+  m[..., 2, 1] = sa
+  m[..., 2, 2] = ca
+  m[..., 2, 3] = DH_D[i]
+  m[..., 3, 3] = 1.0
+  return m
+
+
+def invert(m):
+  """
+  @returns: (..., 4, 4) inverse of rigid transforms
+  """
+  inverse = np.zeros_like(m)
+  rotation = np.swapaxes(m[..., :3, :3], -1, -2)
+  inverse[..., :3, :3] = rotation
+  inverse[..., :3, 3] = -np.einsum('...ij,...j->...i', rotation, m[..., :3, 3])
+  inverse[..., 3, 3] = 1.0
+  return inverse
+
+
+def forward(joints):
+  """
+  @param: joints  (..., 6) joint values
+  @returns: (..., 4, 4) pose of ee_link in base_link
+  """
+  joints = np.asarray(joints, dtype=float)
+  m = dh_matrices(0, joints[..., 0])
+  for i in range(1, 6):
+    m = np.matmul(m, dh_matrices(i, joints[..., i]))
+  return np.matmul(np.matmul(BASE_LINK, m), EE_LINK)
+
+
+def inverse(poses):
+  """
+  Analytic inverse kinematics: up to 8 solutions per pose, from the two shoulder,
+  the two wrist and the two elbow branches
+  @param: poses  (..., 4, 4) poses of ee_link in base_link
+  @returns: (..., 8, 6) joint values in [-pi, pi), NaN for the branches out of reach
+  """
+  t = np.matmul(np.matmul(BASE_LINK, np.asarray(poses, dtype=float)), EE_LINK.T)
+  with np.errstate(invalid='ignore', divide='ignore'):
+    # shoulder: the wrist centre must keep d4 off the plane of the upper arm
+    wrist = t[..., :3, 3] - D6 * t[..., :3, 2]
+    psi = np.arctan2(wrist[..., 1], wrist[..., 0])
+    phi = np.arccos(D4 / np.hypot(wrist[..., 0], wrist[..., 1]))
+    q1 = np.stack((psi + phi, psi - phi), axis=-1) + math.pi / 2
+    s1, c1 = np.sin(q1), np.cos(q1)
+
+    # wrist 2 from the tool position along the shoulder axis
+    def along_shoulder(row):
+      return t[..., 0, row][..., None] * s1 - t[..., 1, row][..., None] * c1
+    q5 = np.arccos((along_shoulder(3) - D4) / D6)
+    q5 = np.stack((q5, -q5), axis=-1)
+    s5 = np.sin(q5)
+
+    # wrist 3 from the shoulder axis seen from the tool, free when the wrist is singular
+    sign = np.where(s5 < 0, -1.0, 1.0)
+    q6 = np.arctan2(-along_shoulder(1)[..., None] * sign, along_shoulder(0)[..., None] * sign)
+    q6 = np.where(np.abs(s5) < 1e-9, 0.0, q6)
+
+    # the planar shoulder lift, elbow, wrist 1 chain, from the wrist 1 position p13
+    # and the direction of its x axis x04 in the plane of the upper arm
+    q1 = np.broadcast_to(q1[..., None], q5.shape)
+    c1, s1 = np.cos(q1), np.sin(q1)
+    c5, c6, s6 = np.cos(q5), np.cos(q6), np.sin(q6)
+
+    def entry(row, column):
+      return t[..., row, column][..., None, None]
+
+    def along_arm(column):
+      return entry(0, column) * c1 + entry(1, column) * s1
+    p13x = D5 * (s6 * along_arm(0) + c6 * along_arm(1)) - D6 * along_arm(2) + along_arm(3)
+    p13y = entry(2, 3) - D1 - D6 * entry(2, 2) + D5 * (entry(2, 1) * c6 + entry(2, 0) * s6)
+    x04x = -s5 * along_arm(2) - c5 * (s6 * along_arm(1) - c6 * along_arm(0))
+    x04y = c5 * (entry(2, 0) * c6 - entry(2, 1) * s6) - entry(2, 2) * s5
+    length = np.hypot(p13x, p13y)
+    q3 = np.arccos((length ** 2 - A2 ** 2 - A3 ** 2) / (2 * A2 * A3))
+    q3 = np.stack((q3, -q3), axis=-1)
+    q2 = (-np.arctan2(p13y, -p13x)[..., None]
+          + np.arcsin(A3 * np.sin(q3) / length[..., None]))
+    # the three joints turn about parallel axes
+    q4 = np.arctan2(x04y, x04x)[..., None] - q2 - q3
+
+  shape = q3.shape
+  q1, q5, q6 = [np.broadcast_to(q[..., None], shape) for q in (q1, q5, q6)]
+  solutions = np.stack((q1, q2, q3, q4, q5, q6), axis=-1)
+  solutions = solutions.reshape(shape[:-3] + (8, 6))
+  return (solutions + math.pi) % (2 * math.pi) - math.pi
+
+
+def nearest_solution(solutions, seed, limit=JOINT_LIMIT):
+  """
+  @param: solutions  (..., 8, 6) array as returned by inverse()
+  @param: seed       (..., 6) joint values to stay close to
+  @returns: (..., 6) solutions turned by whole revolutions to the seed within +-limit,
+            with the smallest largest joint move; NaN where no branch is in reach
+  """
+  seed = np.asarray(seed, dtype=float)[..., None, :]
+  turned = solutions + 2 * math.pi * np.round((seed - solutions) / (2 * math.pi))
+  turned = np.where(turned > limit, turned - 2 * math.pi, turned)
+  turned = np.where(turned < -limit, turned + 2 * math.pi, turned)
+  move = np.abs(turned - seed).max(axis=-1)
+  best = np.argmin(np.where(np.isnan(move), np.inf, move), axis=-1)
+  return np.take_along_axis(turned, best[..., None, None], axis=-2)[..., 0, :]
+
+
+def pose_matrix(x, y, z, yaw=0):
+  """
+  @param: x, y, z, yaw  floats or arrays of the same shape (...)
+  @returns: (..., 4, 4) poses with the orientation of make_pose_goal: roll 0,
+            pitch 1.57 and yaw, i.e. ee_link pointing down
+  """
+  x, y, z, yaw = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (x, y, z, yaw)])
+  pitch = 1.57
+  cy, sy, cp, sp = np.cos(yaw), np.sin(yaw), math.cos(pitch), math.sin(pitch)
+  m = np.zeros(x.shape + (4, 4))
+  m[..., 0, 0] = cy * cp
+  m[..., 0, 1] = -sy
+  m[..., 0, 2] = cy * sp
+  m[..., 0, 3] = x
+  m[..., 1, 0] = sy * cp
+  m[..., 1, 1] = cy
+  m[..., 1, 2] = sy * sp
+  m[..., 1, 3] = y
+  m[..., 2, 0] = -sp
+  m[..., 2, 2] = cp
+  m[..., 2, 3] = z
+  m[..., 3, 3] = 1.0
+  return m
+
+
+def interpolate_poses(start, end, step):
+  """
+  Poses along the straight lines from start to end, at most step apart. The
+  rotation turns about a fixed axis.
+  @param: start, end  (..., 4, 4) poses
+  @returns: (..., N, 4, 4) poses without start, N is the same for the whole batch
+  """
+  distance = np.linalg.norm(end[..., :3, 3] - start[..., :3, 3], axis=-1)
+  # NaN poses of failed plans do not count
+  count = max(1, int(math.ceil(np.max(np.nan_to_num(distance)) / step)))
+  fractions = np.arange(1, count + 1) / float(count)
+
+  poses = np.repeat(end[..., None, :, :], count, axis=-3)
+  poses[..., :3, 3] = (start[..., None, :3, 3]
+                       + fractions[:, None] * (end[..., None, :3, 3] - start[..., None, :3, 3]))
+
+  relative = np.matmul(np.swapaxes(start[..., :3, :3], -1, -2), end[..., :3, :3])
+  angle = np.arccos(np.clip((np.trace(relative, axis1=-2, axis2=-1) - 1) / 2, -1.0, 1.0))
+  if np.max(angle) > 1e-9:
+    with np.errstate(invalid='ignore', divide='ignore'):
+      axis = np.stack((relative[..., 2, 1] - relative[..., 1, 2],
+                       relative[..., 0, 2] - relative[..., 2, 0],
+                       relative[..., 1, 0] - relative[..., 0, 1]), axis=-1) / (2 * np.sin(angle))[..., None]
+    axis = np.where(angle[..., None] > 1e-9, axis, 0.0)
+    k = np.zeros(angle.shape + (3, 3))
+    k[..., 0, 1], k[..., 0, 2] = -axis[..., 2], axis[..., 1]
+    k[..., 1, 0], k[..., 1, 2] = axis[..., 2], -axis[..., 0]
+    k[..., 2, 0], k[..., 2, 1] = -axis[..., 1], axis[..., 0]
+    turn = fractions * angle[..., None]
+    # Rodrigues' formula
+    rotation = (np.identity(3) + np.sin(turn)[..., None, None] * k[..., None, :, :]
+                + (1 - np.cos(turn))[..., None, None] * np.matmul(k, k)[..., None, :, :])
+    poses[..., :3, :3] = np.matmul(start[..., None, :3, :3], rotation)
+  return poses
+
+
+def trapezoid_times(waypoints, velocity=MAX_VELOCITY, acceleration=MAX_ACCELERATION):
+  """
+  Time of each waypoint for a trapezoidal velocity profile along the path. The
+  joint that moves most between two waypoints moves at the profile speed, the
+  others proportionally, so the path is followed without stopping in between.
+  @param: waypoints  (..., N, 6) joint values
+  @returns: (..., N) seconds from the start
+  """
+  waypoints = np.asarray(waypoints, dtype=float)
+  steps = np.abs(np.diff(waypoints, axis=-2)).max(axis=-1)
+  s = np.concatenate((np.zeros(steps.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)), axis=-1)
+  length = s[..., -1:]
+
+  # short moves never reach full speed
+  peak = np.minimum(velocity, np.sqrt(length * acceleration))
+  ramp = peak / acceleration
+  ramp_length = 0.5 * peak * ramp
+  with np.errstate(invalid='ignore', divide='ignore'):
+    duration = 2 * ramp + (length - 2 * ramp_length) / peak
+    return np.where(s <= ramp_length, np.sqrt(2 * s / acceleration),
+                    np.where(s <= length - ramp_length, ramp + (s - ramp_length) / peak,
+                             duration - np.sqrt(np.maximum(0.0, 2 * (length - s) / acceleration))))
+
+
+# trajectory_msgs/JointTrajectory as far as trajectory_end() reads it
+JointTrajectory = namedtuple('JointTrajectory', 'joint_names points')
+TrajectoryPoint = namedtuple('TrajectoryPoint', 'positions time_from_start')
+
+
+class Trajectory(namedtuple('Trajectory', 'joint_names times positions ok')):
+  """Joint trajectories as (..., N) times and (..., N, 6) positions; ok (...) is
+  False where planning failed"""
+  @property
+  def duration(self):
+    return np.where(self.ok, np.nan_to_num(self.times[..., -1]), 0.0)
+
+  @property
+  def end(self):
+    return self.positions[..., -1, :]
+
+  @property
+  def joint_trajectory(self):
+    """
+    @returns: JointTrajectory of a single robot, without points if planning failed
+    """
+    if not np.all(self.ok):
+      return JointTrajectory(self.joint_names, [])
+    return JointTrajectory(self.joint_names, [TrajectoryPoint(p, t) for t, p in zip(self.times, self.positions)])
+
+  def then(self, other):
+    """
+    @returns: Trajectory of self followed by other, which starts where self ends
+    """
+    return Trajectory(self.joint_names,
+                      np.concatenate((self.times, other.times[..., 1:] + self.times[..., -1:]), axis=-1),
+                      np.concatenate((self.positions, other.positions[..., 1:, :]), axis=-2),
+                      self.ok & other.ok)
+
+
+class NullTrace(object):
+  """Stands in for CycleTrace; simulated time is recorded by HeadlessMoveGroup"""
+  @contextmanager
+  def phase(self, name, obj=None):
+    yield
+
+  def record(self, name, duration, obj=None):
+    pass
+
+
+class HeadlessMoveGroup(object):
+  """Stands in for MoveGroupPythonIntefaceTutorial without a ROS stack. Goals are
+  solved with the analytic IK, moves are straight lines in joint space timed
+  with trapezoidal profiles, and executing a trajectory advances a simulated
+  clock instead of waiting. The planning scene is not checked for collisions.
+
+  joints may hold a batch of (..., 6) robots; goals are then given as arrays of
+  the batch shape and every robot moves independently. PickPipeline runs on a
+  single robot with a HeadlessExecutionMonitor."""
+  def __init__(self, joints=(0, -math.pi / 2, 0, -math.pi / 2, 0, 0), velocity_scaling=1.0,
+               acceleration_scaling=1.0, approach_distance=0.05, grasp_duration=0.5,
+               eef_step=0.005, max_jump=0.5):
+    """
+    @param: grasp_duration  simulated seconds for closing the gripper at the bottom of the descend
+    @param: max_jump        largest joint move in rad between two waypoints of a straight path
+    """
+    self.joints = np.array(joints, dtype=float)
+    self.velocity = MAX_VELOCITY * velocity_scaling
+    self.acceleration = MAX_ACCELERATION * acceleration_scaling
+    self.approach_distance = approach_distance
+    self.grasp_duration = grasp_duration
+    self.eef_step = eef_step
+    self.max_jump = max_jump
+
+    # simulated seconds per robot
+    self.clock = np.zeros(self.joints.shape[:-1])
+    # phase -> simulated seconds summed over the batch
+    self.phases = OrderedDict()
+    self.trace = NullTrace()
+    # the pipeline stops the move group after a failed execution
+    self.move_group = self
+
+  def record(self, name, duration):
+    self.clock = self.clock + duration
+    self.phases[name] = self.phases.get(name, 0.0) + float(np.sum(duration))
+
+  def make_pose_goal(self, x, y, z, yaw=0):
+    return pose_matrix(x, y, z, yaw)
+
+  def current_pose(self):
+    return forward(self.joints)
+
+  def stop(self):
+    pass
+
+  def time_path(self, waypoints, ok):
+    times = trapezoid_times(waypoints, self.velocity, self.acceleration)
+    return Trajectory(JOINT_NAMES, times, waypoints, ok)
+
+  def start_positions(self, start):
+    """
+    @param: start  (joint names, positions) as returned by trajectory_end(), None for the current joints
+    """
+    return self.joints if start is None else np.asarray(start[1], dtype=float)
+
+  def plan_to(self, goal, start=None):
+    """
+    Plan to a pose or a list of joint values without executing
+    @param: goal   (..., 4, 4) poses, joint values, a PickGoal or a PlaceGoal
+    @param: start  (joint names, positions) to plan from instead of the current joints
+    @returns: Trajectory, not ok where the pose is out of reach; a PickPlan for a PickGoal
+    """
+    if isinstance(goal, PickGoal):
+      return self.plan_pick(goal, start)
+    if isinstance(goal, PlaceGoal):
+      goal = goal.joints
+    return self.plan_move(goal, self.start_positions(start))
+
+  def plan_move(self, goal, start):
+    """
+    @param: start  joint values to plan from
+    """
+    goal = np.asarray(goal, dtype=float)
+    if goal.shape[-2:] == (4, 4):
+      goal = nearest_solution(inverse(goal), start)
+    goal = np.broadcast_to(goal, start.shape)
+    return self.time_path(np.stack((start, goal), axis=-2), ~np.isnan(goal).any(axis=-1))
+
+  def plan_straight(self, pose, start):
+    """
+    Straight-line cartesian path to pose, each waypoint solved next to the previous one
+    @param: start  joint values the path starts from
+    @returns: Trajectory, not ok where the path is not fully feasible
+    """
+    start = np.asarray(start, dtype=float)
+    solutions = inverse(interpolate_poses(forward(start), pose, self.eef_step))
+    waypoints = [start]
+    for i in range(solutions.shape[-3]):
+      waypoints.append(nearest_solution(solutions[..., i, :, :], waypoints[-1]))
+    waypoints = np.stack(waypoints, axis=-2)
+    # a branch change on the way is a jump, not a straight line
+    jumps = np.abs(np.diff(waypoints, axis=-2)).max(axis=-1)
+    ok = ~(np.isnan(jumps) | (jumps > self.max_jump)).any(axis=-1)
+    return self.time_path(waypoints, ok)
+
+  def pick_segments(self, goal, start):
+    """
+    Free-space move to the pre-grasp pose at z, the descend of approach_distance and the lift
+    @param: goal   PickGoal, its fields may be arrays of the batch shape
+    @param: start  joint values to plan from
+    @returns: (approach, descend, lift) Trajectories, all not ok where any segment failed
+    """
+    yaw = fold_yaw(np.asarray(goal.yaw, dtype=float))
+    pre_grasp = pose_matrix(goal.x, goal.y, goal.z, yaw)
+    grasp = pose_matrix(goal.x, goal.y, np.asarray(goal.z) - self.approach_distance, yaw)
+    approach = self.plan_move(pre_grasp, start)
+    descend = self.plan_straight(grasp, approach.end)
+    # the lift retraces the descend, solving it again would give the same waypoints
+    lift = self.time_path(descend.positions[..., ::-1, :], descend.ok)
+    ok = approach.ok & descend.ok & lift.ok
+    return approach._replace(ok=ok), descend._replace(ok=ok), lift._replace(ok=ok)
+
+  def plan_pick(self, goal, start=None):
+    """
+    @param: goal   A PickGoal, z is the pre-grasp height
+    @param: start  (joint names, positions) to plan from instead of the current joints
+    @returns: PickPlan, the approach ends at the grasp pose
+    """
+    approach, descend, lift = self.pick_segments(goal, self.start_positions(start))
+    return PickPlan(approach.then(descend), lift)
+
+  def execute(self, trajectory, phase='execute'):
+    """
+    @returns: ok of the trajectory; robots whose plan failed do not move
+    """
+    self.record(phase, trajectory.duration)
+    self.joints = np.where(trajectory.ok[..., None], trajectory.end, self.joints)
+    return trajectory.ok
+
+  def go_to_joint_state(self, joint_goal):
+    return self.execute(self.plan_to(joint_goal))
+
+  def go_to_pose_goal(self, x, y, z, yaw=0):
+    return self.execute(self.plan_to(pose_matrix(x, y, z, yaw)))
+
+  def pick(self, x, y, z, yaw=0):
+    """
+    @returns: ok, False where the object is out of reach; the arm does not move then
+    """
+    approach, descend, lift = self.pick_segments(PickGoal(x, y, z, yaw), self.joints)
+    self.execute(approach, 'approach')
+    self.execute(descend, 'descend')
+    self.record('grasp', np.where(approach.ok, self.grasp_duration, 0.0))
+    self.execute(lift, 'lift')
+    return approach.ok
+
+
+class HeadlessExecutionMonitor(object):
+  """Stands in for ExecutionMonitor: a trajectory is executed on the simulated
+  clock as soon as it is sent"""
+  def __init__(self, robot):
+    self.robot = robot
+    self.ok = False
+
+  def execute(self, plan):
+    self.ok = bool(np.all(self.robot.execute(plan)))
+
+  def stop(self):
+    pass
+
+  def wait(self, timeout=None):
+    return self.ok
+
+
+class HeadlessGripper(object):
+  """Gripper that always confirms the grasp after grasp_duration simulated seconds"""
+  def __init__(self, robot):
+    self.robot = robot
+
+  def grasp(self):
+    self.robot.record('grasp', self.robot.grasp_duration)
+    return True
+
+  def release(self):
+    return True
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 
+import os
 import sys
 import copy
 import rospy
@@ -15,11 +16,24 @@ from moveit_commander.conversions import pose_to_list
 from moveit_msgs.msg import Constraints, JointConstraint, OrientationConstraint
 from tf.transformations import quaternion_from_euler, euler_from_quaternion
 import random
+from collections import namedtuple
 from gazebo_msgs.srv import GetModelState
 from geometry_msgs.msg import PointStamped, PoseStamped, PoseArray, Pose
 import tf
+import rospkg
 from obj_detection.srv import GetObject
 from builtins import input
+from pick_pipeline import PickPipeline
+from pick_goals import PickGoal, PickPlan, PlaceGoal, trajectory_end
+from plan_cache import TrajectoryCache
+from pose_batch import transform_poses
+from pick_order import order_picks, fold_yaw
+from detection_queue import DetectionQueue
+from ik_cache import IKSeedCache
+from scene_monitor import SceneMonitor, make_box, attach_object, detach_object
+from scene_loader import SceneLoader
+from cycle_trace import CycleTrace
+from grasp_stage import make_gripper
 
 ## END_SUB_TUTORIAL
 
@@ -46,6 +60,16 @@ def all_close(goal, actual, tolerance):
 
   return True
 
+def trajectory_of(plan_result):
+  """
+  MoveGroupCommander.plan() returns a RobotTrajectory on Melodic and
+  (success, trajectory, planning_time, error_code) on Noetic
+  @returns: RobotTrajectory
+  """
+  if isinstance(plan_result, tuple):
+    return plan_result[1]
+  return plan_result
+
 #TODO: 
 class Fruit:
   def __init__(self,name):
@@ -96,22 +120,47 @@ class MoveGroupPythonIntefaceTutorial(object):
 
     self.sphere_img_orien = 0
 
+    # depth of the straight descend below the pre-grasp pose, speed of the joined pick trajectory
+    self.approach_distance = rospy.get_param('~approach_distance', 0.05)
+    self.velocity_scaling = rospy.get_param('~velocity_scaling', 1.0)
+
+    # IK solutions over the pick plane, solved on demand after reset_ik()
+    self.ik_cache = IKSeedCache(group_name, self.make_pose_goal, planning_frame,
+                                **rospy.get_param('~ik_grid', {}))
+
+    # the detector returns its yaw angle in orientation.w instead of a quaternion
+    self.detector_yaw_in_w = rospy.get_param('~detector_yaw_in_w', True)
+
+    # per-phase timings, published on ~cycle_stats
+    self.trace = CycleTrace()
+
+    self.scene_monitor = SceneMonitor()
+    self.scene_loader = SceneLoader(self.scene_monitor, frame_id="world")
+
+    # planned trajectories are reused in a planning scene with the same content
+    self.plan_cache = TrajectoryCache(group_name,
+                                      file_path=rospy.get_param('~plan_cache_file', None))
+
   def go_to_joint_state(self,joint_goal):
     move_group = self.move_group
 
-    move_group.go(joint_goal, wait=True)
+    with self.trace.phase('plan'):
+      plan = self.plan_to(joint_goal)
+    if not plan.joint_trajectory.points:
+      return False
+    with self.trace.phase('execute'):
+      move_group.execute(plan, wait=True)
     
-    # ensure no residual movement
-    move_group.stop()
+    with self.trace.phase('settle'):
+      # ensure no residual movement
+      move_group.stop()
 
-    # For testing:
-    current_joints = move_group.get_current_joint_values()
+      # For testing:
+      current_joints = move_group.get_current_joint_values()
     return all_close(joint_goal, current_joints, 0.01)
 
 
-  def go_to_pose_goal(self,x,y,z,yaw=0):
-    move_group = self.move_group
-
+  def make_pose_goal(self,x,y,z,yaw=0):
     #  Pose Orientation - Fixed
     roll_angle = 0
     pitch_angle = 1.57
@@ -119,7 +168,6 @@ class MoveGroupPythonIntefaceTutorial(object):
     quaternion = quaternion_from_euler(roll_angle, pitch_angle, yaw_angle)
 
     pose_goal = geometry_msgs.msg.Pose()
-    # pose_goal.orientation.z = 1.4
     pose_goal.orientation.x = quaternion[0]
     pose_goal.orientation.y = quaternion[1]
     pose_goal.orientation.z = quaternion[2]
@@ -128,23 +176,160 @@ class MoveGroupPythonIntefaceTutorial(object):
     pose_goal.position.x = x
     pose_goal.position.y = y
     pose_goal.position.z = z
+    return pose_goal
 
-    move_group.set_pose_target(pose_goal)
 
-    plan = move_group.go(wait=True)
-    # Calling `stop()` ensures that there is no residual movement
-    move_group.stop()
-    move_group.clear_pose_targets()
+  def go_to_pose_goal(self,x,y,z,yaw=0):
+    move_group = self.move_group
 
-    current_pose = self.move_group.get_current_pose().pose
+    pose_goal = self.make_pose_goal(x,y,z,yaw)
+
+    with self.trace.phase('ik'):
+      joint_goal = self.ik_cache.joint_goal(x, y, z, yaw)
+    with self.trace.phase('plan'):
+      plan = self.plan_to(pose_goal if joint_goal is None else joint_goal)
+    if not plan.joint_trajectory.points:
+      return False
+    with self.trace.phase('execute'):
+      move_group.execute(plan, wait=True)
+    with self.trace.phase('settle'):
+      # Calling `stop()` ensures that there is no residual movement
+      move_group.stop()
+
+      current_pose = self.move_group.get_current_pose().pose
     return all_close(pose_goal, current_pose, 0.01)
 
 
+  def reset_ik(self, seed):
+    """
+    @param: seed  joint values the first IK cell is solved from, e.g. the observe pose
+    """
+    self.ik_cache.reset(self.move_group.get_active_joints(), seed)
+
+
+  def robot_state_at(self, start):
+    """
+    @param: start  (joint names, positions)
+    @returns: RobotState, the current state with the given joints replaced
+    """
+    joint_names, positions = start
+    state = self.robot.get_current_state()
+    state_positions = list(state.joint_state.position)
+    for name, value in zip(joint_names, positions):
+      state_positions[state.joint_state.name.index(name)] = value
+    state.joint_state.position = state_positions
+    return state
+
+
+  def plan_to(self, goal, start=None):
+    """
+    Plan to a Pose or a list of joint values without executing
+    @param: goal   A Pose, a list of joint values, a PickGoal or a PlaceGoal
+    @param: start  (joint names, positions) to plan from instead of the current state,
+                   e.g. the end of a trajectory that is still executing
+    @returns: RobotTrajectory, empty if planning failed
+    """
+    move_group = self.move_group
+
+    if isinstance(goal, PickGoal):
+      return self.plan_pick(goal, start)
+    if isinstance(goal, PlaceGoal):
+      goal = goal.joints
+
+    if start is None:
+      start_positions = move_group.get_current_joint_values()
+    else:
+      start_positions = start[1]
+    scene_key = self.scene_monitor.scene_key()
+    plan = self.plan_cache.get(start_positions, goal, scene_key)
+    if plan is not None:
+      return plan
+
+    if start is not None:
+      move_group.set_start_state(self.robot_state_at(start))
+
+    if type(goal) is geometry_msgs.msg.Pose:
+      move_group.set_pose_target(goal)
+    else:
+      move_group.set_joint_value_target(goal)
+
+    plan = trajectory_of(move_group.plan())
+    move_group.clear_pose_targets()
+    move_group.set_start_state_to_current_state()
+    self.plan_cache.put(start_positions, goal, scene_key, plan)
+    return plan
+
+
+  def plan_pick(self, goal, start=None):
+    """
+    Pick primitive: free-space plan to the pre-grasp pose above the object, then
+    a straight descend of approach_distance and the lift back
+    @param: goal   A PickGoal, z is the pre-grasp height
+    @param: start  (joint names, positions) to plan from instead of the current state
+    @returns: PickPlan, the approach ends at the grasp pose, an empty
+              RobotTrajectory if any segment failed
+    """
+    move_group = self.move_group
+
+    yaw = fold_yaw(goal.yaw)
+    pre_grasp = self.make_pose_goal(goal.x, goal.y, goal.z, yaw)
+    # a joint goal next to the cached solution keeps the wrist from flipping
+    joint_goal = self.ik_cache.joint_goal(goal.x, goal.y, goal.z, yaw)
+    free_plan = self.plan_to(pre_grasp if joint_goal is None else joint_goal, start)
+    free_end = trajectory_end(free_plan)
+    if free_end is None:
+      return free_plan
+
+    grasp = copy.deepcopy(pre_grasp)
+    grasp.position.z -= self.approach_distance
+
+    descend = self.plan_straight(grasp, free_end)
+    descend_end = trajectory_end(descend)
+    if descend_end is None:
+      return moveit_msgs.msg.RobotTrajectory()
+    lift = self.plan_straight(pre_grasp, descend_end)
+    if trajectory_end(lift) is None:
+      return moveit_msgs.msg.RobotTrajectory()
+
+    # the descend starts where the free-space segment ends
+    approach = copy.deepcopy(free_plan)
+    points = approach.joint_trajectory.points
+    offset = points[-1].time_from_start
+    for point in descend.joint_trajectory.points[1:]:
+      point.time_from_start += offset
+      points.append(point)
+
+    start_state = self.robot_state_at((approach.joint_trajectory.joint_names, points[0].positions))
+    approach = move_group.retime_trajectory(start_state, approach, self.velocity_scaling)
+    lift = move_group.retime_trajectory(self.robot_state_at(descend_end), lift, self.velocity_scaling)
+    return PickPlan(approach, lift)
+
+
+  def plan_straight(self, pose, start):
+    """
+    Straight-line cartesian path to pose
+    @param: start  (joint names, positions) the path starts from
+    @returns: RobotTrajectory, empty if the path is not fully feasible
+    """
+    move_group = self.move_group
+
+    move_group.set_start_state(self.robot_state_at(start))
+    (plan, fraction) = move_group.compute_cartesian_path(
+                                       [pose],  # waypoints to follow
+                                       0.005,   # eef_step
+                                       0.0)     # jump_threshold
+    move_group.set_start_state_to_current_state()
+    if fraction < 1.0:
+      rospy.logwarn("Cartesian path covers only %.0f%% of the way" % (fraction * 100))
+      return moveit_msgs.msg.RobotTrajectory()
+    return plan
+
+
   def plan_goal(self,x,y,z):
     move_group = self.move_group
 
     roll_angle = 0
-    pitch_angle = 1.5708
+    pitch_angle = 1.57
     yaw_angle = 0
     quaternion = quaternion_from_euler(roll_angle, pitch_angle, yaw_angle)
 
@@ -157,7 +342,11 @@ class MoveGroupPythonIntefaceTutorial(object):
     pose_goal.position.y = y
     pose_goal.position.z = z
 
-    move_group.set_pose_target(pose_goal)
+    joint_goal = self.ik_cache.joint_goal(x, y, z, yaw_angle)
+    if joint_goal is None:
+      move_group.set_pose_target(pose_goal)
+    else:
+      move_group.set_joint_value_target(joint_goal)
 
     ## Now, we call the planner to compute the plan and execute it.
     plan = move_group.plan()
@@ -206,32 +395,11 @@ class MoveGroupPythonIntefaceTutorial(object):
 
 
   def wait_for_state_update(self, box_is_known=False, box_is_attached=False, timeout=4):
-    box_name = self.box_name
-    scene = self.scene
-
-    start = rospy.get_time()
-    seconds = rospy.get_time()
-    while (seconds - start < timeout) and not rospy.is_shutdown():
-      # Test if the box is in attached objects
-      attached_objects = scene.get_attached_objects([box_name])
-      is_attached = len(attached_objects.keys()) > 0
-
-      # Test if the box is in the scene.
-      # Note that attaching the box will remove it from known_objects
-      is_known = box_name in scene.get_known_object_names()
-
-      # Test if we are in the expected state
-      if (box_is_attached == is_attached) and (box_is_known == is_known):
-        return True
-
-      # Sleep so that we give other threads time on the processor
-      rospy.sleep(0.1)
-      seconds = rospy.get_time()
-
-    # If we exited the while loop without returning then we timed out
-    return False
+    # returns as soon as move_group publishes the expected scene, False on timeout
+    return self.scene_monitor.wait_for(self.box_name, known=box_is_known,
+                                       attached=box_is_attached, timeout=timeout)
 
-  def add_box(self, *args):
+  def add_box(self, *args, **kwargs):
     timeout=4
     scene = self.scene
 
@@ -242,51 +410,34 @@ class MoveGroupPythonIntefaceTutorial(object):
     box_pose.pose.position.x = args[0]
     box_pose.pose.position.y = args[1]
     box_pose.pose.position.z = 0.05
-    box_name = "box"
-    scene.add_box(box_name, box_pose, size=(0.1, 0.1, 0.1))
+    box_name = kwargs.get('name', "box")
+    self.scene_loader.add(make_box(box_name, box_pose, (0.1, 0.1, 0.1)))
+    self.scene_loader.apply([box_name])
 
     self.box_name=box_name
     return self.wait_for_state_update(box_is_known=True, timeout=timeout)
 
   def add_bbox(self, timeout=4):
-    # Create boundary box environment
-    box_name = self.box_name
-    scene = self.scene
-
-    wall1_pose = geometry_msgs.msg.PoseStamped()
-    wall1_pose.header.frame_id = "world"
-
-    wall2_pose = geometry_msgs.msg.PoseStamped()
-    wall2_pose.header.frame_id = "world"
-
-    box_pose = geometry_msgs.msg.PoseStamped()
-    box_pose.header.frame_id = "world"
-
-    wall1_pose.pose.orientation.w = 1.0
-    wall1_pose.pose.position.x = -0.25
-    wall1_pose.pose.position.y = -0.5
-    wall1_pose.pose.position.z = 0.5 # right wall
-
-    wall2_pose.pose.orientation.w = 1.0
-    wall2_pose.pose.position.x = -0.65
-    wall2_pose.pose.position.y = 0.0
-    wall2_pose.pose.position.z = 0.5 # back wall
-
-    box_pose.pose.orientation.w = 1.0
-    box_pose.pose.position.x = 0.0
-    box_pose.pose.position.y = 0.0
-    box_pose.pose.position.z = -0.05 # base
-
-    wall1_name = "box1"
-    wall2_name = "box2"
-    box_name = "base"
-
-    scene.add_box(wall1_name, wall1_pose, size=(1, 0.2, 1))
-    scene.add_box(wall2_name, wall2_pose, size=(0.2, 0.8, 1))
-    scene.add_box(box_name, box_pose, size=(1.5, 1.5, 0.1))
-
-    self.box_name=box_name
-    self.box_names = [box_name, wall1_name, wall2_name]
+    # Create boundary box environment from the scene config and, if given, the static
+    # models of a Gazebo world, all in one planning scene diff
+    loader = self.scene_loader
+    names = loader.load_yaml(rospy.get_param('~scene_file', os.path.join(
+        rospkg.RosPack().get_path('ur5_pick_place'), 'config', 'scene.yaml')))
+    world_file = rospy.get_param('~world_file', None)
+    if world_file:
+      names += loader.load_world(world_file,
+                                 origin=rospy.get_param('~world_origin', [0, 0, 0.75]),
+                                 exclude=rospy.get_param('~world_exclude', []))
+    loader.apply(names)
+
+    self.box_names = names
+    if not names:
+      return True
+    # the registration order of the YAML objects is not defined, wait on a named one
+    self.box_name = rospy.get_param('~scene_wait_object', 'base')
+    if self.box_name not in names:
+      rospy.logwarn("Scene object %s is not registered, waiting for %s" % (self.box_name, min(names)))
+      self.box_name = min(names)
     return self.wait_for_state_update(box_is_known=True, timeout=timeout)
 
 
@@ -300,7 +451,7 @@ class MoveGroupPythonIntefaceTutorial(object):
     grasping_group = 'endeffector'
     touch_links = robot.get_link_names(group=grasping_group)
 
-    scene.attach_box(eef_link, box_name, touch_links=touch_links)
+    self.scene_monitor.apply(attached_objects=[attach_object(eef_link, box_name, touch_links)])
 
     # wait for the planning scene to update.
     return self.wait_for_state_update(box_is_attached=True, box_is_known=False, timeout=timeout)
@@ -311,55 +462,104 @@ class MoveGroupPythonIntefaceTutorial(object):
     scene = self.scene
     eef_link = self.eef_link
 
-    scene.remove_attached_object(eef_link, name=box_name)
+    self.scene_monitor.apply(attached_objects=[detach_object(eef_link, box_name)])
 
     # wait for the planning scene to update.
     return self.wait_for_state_update(box_is_known=True, box_is_attached=False, timeout=timeout)
 
 
-  def remove_box(self, timeout=4):
-    box_name = self.box_name
-    scene = self.scene
-
-    scene.remove_world_object("box")
+  def remove_box(self, timeout=4, name="box"):
+    self.scene_loader.remove([name])
 
     # wait for the planning scene to update.
-    return self.wait_for_state_update(box_is_attached=False, box_is_known=False, timeout=timeout)
+    return self.scene_monitor.wait_for(name, known=False, attached=False, timeout=timeout)
 
 
   def transf_pose_arr(self,pose_arr):
-    tf_pose_array = []
-    pose = PoseStamped()
-    pose.header.frame_id = "camera_depth_optical_frame"
-
-    for p in pose_arr.poses:
-      pose.pose = p
-      tf_pose = listener.transformPose("base_link",pose)
-      tf_pose.pose.orientation.w = p.orientation.w 
-      tf_pose_array.append(tf_pose.pose)
+    # one lookup for the whole detection batch, at the time of the image if it is known
+    stamp = pose_arr.header.stamp
+    if stamp.is_zero():
+      stamp = rospy.Time(0)
+    with self.trace.phase('tf_lookup'):
+      listener.waitForTransform("base_link", "camera_depth_optical_frame", stamp, rospy.Duration(1.0))
+      translation, rotation = listener.lookupTransform("base_link", "camera_depth_optical_frame", stamp)
+    with self.trace.phase('transform'):
+      tf_pose_array = transform_poses(translation, rotation, pose_arr.poses,
+                                      yaw_in_w=self.detector_yaw_in_w)
 
     print(tf_pose_array)
     return tf_pose_array
 
-def trigger_pick_and_place(data):
-  print("-------- Started --------")
-  try:
-    pose = obj_srv(data.data)
-    print(pose.poses.poses)
+# time since which the arm waits at the observe pose, None while a cycle moves it
+observe_since = None
+
+# capture time and base_link poses of the detected objects
+Detection = namedtuple('Detection', 'stamp poses')
 
-    if pose.poses.poses:
-      pose_tf = tutorial.transf_pose_arr(pose.poses)
+def detect_objects(colour):
+  """
+  @returns: Detection of the objects of the given colour
+  """
+  stamp = rospy.get_time()
+  with tutorial.trace.phase('detect'):
+    pose = obj_srv(colour)
+  print(pose.poses.poses)
+  if not pose.poses.header.stamp.is_zero():
+    stamp = pose.poses.header.stamp.to_sec()
+  if not pose.poses.poses:
+    return Detection(stamp, [])
+  return Detection(stamp, tutorial.transf_pose_arr(pose.poses))
+
+def is_current(detection):
+  """
+  A detection prefetched during a cycle was taken by the wrist camera away from the
+  observe pose, sees only part of the table and may contain the object picked in it
+  @returns: bool, True if it was taken at the observe pose after the last cycle ended
+  """
+  return detection is not None and observe_since is not None and detection.stamp >= observe_since
 
-      for p in pose_tf:
-        tutorial.go_to_pose_goal(p.position.x, p.position.y,0.18,p.orientation.w-1.5708)
-        rospy.sleep(2.0)
-      tutorial.go_to_joint_state(observe_goal)
+def pick_objects(colour, detection):
+  global observe_since
+  print("-------- Started --------")
+  try:
+    if observe_since is None:
+      # the last cycle did not get back to the observe pose
+      if tutorial.go_to_joint_state(observe_goal):
+        observe_since = rospy.get_time()
+    if not is_current(detection):
+      detection = detect_objects(colour)
+
+    if detection.poses:
+      # grasp yaw of each object about the base_link z axis
+      targets = [(p.position.x, p.position.y, 0.18,
+                  euler_from_quaternion([p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w])[2])
+                 for p in detection.poses]
+
+      # visit the objects in the order with the least travel, starting and ending at the observe pose
+      start = tutorial.move_group.get_current_pose().pose.position
+      order = order_picks((start.x, start.y, start.z, None), targets)
+
+      goals = []
+      for i in order:
+        goals.append(PickGoal(*targets[i]))
+        if place_goal:
+          goals.append(PlaceGoal(place_goal))
+      goals.append(observe_goal)
+      # plans each move while the previous one executes
+      observe_since = None
+      with tutorial.trace.phase('cycle'):
+        reached = pipeline.run(goals)
+      if reached[-1]:
+        observe_since = rospy.get_time()
 
     print("-------- Finished --------")
-    rospy.sleep(2.0)
   except Exception as e:
     print(e)
 
+def trigger_pick_and_place(data):
+  # the pick itself runs on the queue's worker threads, not in this callback
+  pick_queue.submit(data.data)
+
 
 if __name__ == '__main__':
 
@@ -385,11 +585,22 @@ if __name__ == '__main__':
   tutorial.add_bbox()
 
   tutorial.go_to_joint_state(observe_goal)
+  observe_since = rospy.get_time()
+
+  tutorial.reset_ik(observe_goal)
 
   print("============ waiting for obj detect service ...")
   rospy.wait_for_service('/get_obj_clr')
   obj_srv = rospy.ServiceProxy('/get_obj_clr', GetObject)
 
+  # the grasp is confirmed by the gripper before the lift, failed picks are retried or skipped
+  gripper = make_gripper(rospy.get_param('~gripper', 'none'), **rospy.get_param('~gripper_options', {}))
+  place_goal = rospy.get_param('~place_goal', None)
+  pipeline = PickPipeline(tutorial, gripper=gripper, grasp_retries=rospy.get_param('~grasp_retries', 1))
+  rospy.on_shutdown(tutorial.plan_cache.save)
+  rospy.on_shutdown(tutorial.trace.report)
+
+  pick_queue = DetectionQueue(detect_objects, pick_objects, maxsize=rospy.get_param('~queue_size', 4))
   rospy.Subscriber("object_colour", String, trigger_pick_and_place)
 
   print("Ready to perform pick and place.")
@@ -0,0 +1,72 @@
+import itertools
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from pick_order import cost_matrix, fold_yaw, nearest_neighbour, order_picks, tour_cost, two_opt
+
+START = (0.3, 0.0, 0.4, None)
+
+
+def random_targets(rng, count):
+  return [(rng.uniform(0.25, 0.55), rng.uniform(-0.25, 0.25), 0.18, rng.uniform(-math.pi, math.pi))
+          for _ in range(count)]
+
+
+def brute_force_cost(cost):
+  return min(tour_cost([0] + list(rest), cost) for rest in itertools.permutations(range(1, len(cost))))
+
+
+def order_cost(order, cost):
+  return tour_cost([0] + [i + 1 for i in order], cost)
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 3])
+def test_small_sets_are_optimal(count):
+  rng = random.Random(count)
+  for _ in range(50):
+    targets = random_targets(rng, count)
+    cost = cost_matrix([START] + targets)
+    order = order_picks(START, targets)
+    assert sorted(order) == list(range(count))
+    if count:
+      assert order_cost(order, cost) == pytest.approx(brute_force_cost(cost))
+
+
+@pytest.mark.parametrize('count', [4, 5, 6, 7])
+def test_close_to_brute_force(count):
+  rng = random.Random(count)
+  ratios = []
+  for _ in range(30):
+    targets = random_targets(rng, count)
+    cost = cost_matrix([START] + targets)
+    order = order_picks(START, targets)
+    assert sorted(order) == list(range(count))
+    ratios.append(order_cost(order, cost) / brute_force_cost(cost))
+  assert min(ratios) >= 1.0 - 1e-9
+  assert sum(ratios) / len(ratios) < 1.02
+  assert max(ratios) < 1.15
+
+
+def test_two_opt_never_worse_than_nearest_neighbour():
+  rng = random.Random(0)
+  for _ in range(50):
+    cost = cost_matrix([START] + random_targets(rng, 8))
+    tour = nearest_neighbour(cost)
+    improved = two_opt(tour, cost)
+    assert improved[0] == 0
+    assert sorted(improved) == sorted(tour)
+    assert tour_cost(improved, cost) <= tour_cost(tour, cost) + 1e-9
+
+
+def test_fold_yaw():
+  for yaw in (-3 * math.pi, -math.pi / 2, -1.0, 0.0, 1.0, math.pi / 2, 2.5, 7.0):
+    folded = fold_yaw(yaw)
+    assert -math.pi / 2 <= folded < math.pi / 2
+    # the same grasp up to a half turn
+    assert math.sin(2 * (folded - yaw)) == pytest.approx(0.0, abs=1e-9)
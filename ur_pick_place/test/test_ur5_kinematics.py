@@ -0,0 +1,77 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from pick_goals import PickGoal, PickPlan, trajectory_end
+from ur5_kinematics import (HeadlessMoveGroup, forward, inverse, nearest_solution, pose_matrix,
+                            trapezoid_times)
+
+OBSERVE_GOAL = [-0.27640452940659355, -1.5613947841166143, 0.8086120509001136,
+                -0.8173772811698496, -1.5702185440399328, -0.2754254250487067]
+
+
+def random_joints(count, seed=0):
+  rng = np.random.RandomState(seed)
+  joints = rng.uniform(-math.pi, math.pi, (count, 6))
+  # keep away from the wrist and elbow singularities
+  joints[:, 4] = np.sign(joints[:, 4]) * np.clip(np.abs(joints[:, 4]), 0.2, math.pi - 0.2)
+  joints[:, 2] = np.sign(joints[:, 2]) * np.clip(np.abs(joints[:, 2]), 0.2, math.pi - 0.2)
+  return joints
+
+
+def test_forward_of_every_inverse_solution_is_the_pose():
+  poses = forward(random_joints(200))
+  solutions = inverse(poses)
+  assert solutions.shape == (200, 8, 6)
+  reached = forward(np.nan_to_num(solutions))
+  valid = ~np.isnan(solutions).any(axis=-1)
+  assert valid.any(axis=-1).all()
+  assert np.allclose(reached[valid], np.repeat(poses[:, None], 8, axis=1)[valid], atol=1e-6)
+
+
+def test_inverse_recovers_the_joints():
+  joints = random_joints(200, seed=1)
+  recovered = nearest_solution(inverse(forward(joints)), joints)
+  assert np.allclose(recovered, joints, atol=1e-6)
+
+
+def test_out_of_reach_is_nan():
+  solutions = inverse(pose_matrix(2.0, 0.0, 0.2, 0.0))
+  assert np.isnan(solutions).any(axis=-1).all()
+  assert np.isnan(nearest_solution(solutions, OBSERVE_GOAL)).any()
+  assert not HeadlessMoveGroup(OBSERVE_GOAL).go_to_pose_goal(2.0, 0.0, 0.2)
+
+
+def test_pose_goal_orientation_points_down():
+  pose = forward(nearest_solution(inverse(pose_matrix(0.4, 0.1, 0.18, 0.3)), OBSERVE_GOAL))
+  assert np.allclose(pose[:3, 3], [0.4, 0.1, 0.18], atol=1e-6)
+  # make_pose_goal's pitch of 1.57 turns the ee_link x axis down
+  assert pose[2, 0] == pytest.approx(-math.sin(1.57))
+
+
+def test_trapezoid_times_are_monotonic_and_symmetric():
+  waypoints = np.linspace(0.0, 2.0, 21)[:, None] * np.ones(6)
+  times = trapezoid_times(waypoints)
+  assert times[0] == 0.0
+  assert (np.diff(times) > 0).all()
+  steps = np.diff(times)
+  assert np.allclose(steps, steps[::-1])
+
+
+def test_headless_plan_pick_matches_the_node_signature():
+  robot = HeadlessMoveGroup(OBSERVE_GOAL)
+  plan = robot.plan_to(PickGoal(0.4, 0.1, 0.18, 2.5))
+  assert isinstance(plan, PickPlan)
+  names, positions = trajectory_end(plan.approach)
+  grasp = forward(positions)
+  assert np.allclose(grasp[:3, 3], [0.4, 0.1, 0.18 - robot.approach_distance], atol=1e-6)
+
+  # planning from the end of the pick, as the pipeline does while the arm moves
+  back = robot.plan_to(OBSERVE_GOAL, start=trajectory_end(plan))
+  assert np.allclose(trajectory_end(back)[1], OBSERVE_GOAL)
+  assert np.allclose(back.positions[0], trajectory_end(plan.lift)[1])